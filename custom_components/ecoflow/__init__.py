@@ -1,26 +1,79 @@
+import asyncio
+import os
+import shutil
+from collections import deque
 from datetime import timedelta
-from typing import Any, Callable, Optional, TypeVar, cast
+from logging import getLogger
+from time import monotonic, perf_counter
+from typing import Any, Callable, Optional, TypeVar
 
-import reactivex.operators as ops
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_HOST, CONF_MAC, Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers import event
-from homeassistant.helpers.device_registry import CONNECTION_NETWORK_MAC
+from homeassistant.helpers.device_registry import (CONNECTION_NETWORK_MAC,
+                                                   format_mac)
 from homeassistant.helpers.device_registry import async_get as async_get_dr
+from homeassistant.helpers.dispatcher import async_dispatcher_send
 from homeassistant.helpers.entity import DeviceInfo, Entity, EntityCategory
+from homeassistant.helpers.storage import Store
 from homeassistant.util.dt import utcnow
-from reactivex import Observable, Subject, compose, throw
-from reactivex.subject.replaysubject import ReplaySubject
+import voluptuous as vol
 
 from . import ecoflow as ef
-from .ecoflow import receive
-from .ecoflow.rxtcp import RxTcpAutoConnection
-
+from .ecoflow import discovery, receive
+from .ecoflow.derive import Deriver
+from .ecoflow.health import PackHealth
+from .ecoflow.proxy import LOCALHOST, MuxProxy
+from .ecoflow.rxtcp import (PRIORITY_AUTOMATION, PRIORITY_INTERACTIVE,
+                            PRIORITY_POLL, RxTcpAutoConnection)
+from .ecoflow.shard import ShardPool
+from .ecoflow.stream import LatestSubject, ReplaySubject, Subject, first
+from .ecoflow.trace import Tracer
+from .export import EXPORT_DIR, FLUSH_INTERVAL, TelemetryExporter
+from .fleet import Fleet
+from .history import HISTORY_DIR, History, parse_fields
+from .metrics import MetricsView
+from .profiles import SETTINGS_SCHEMA, apply_profile
+from .profiler import MODE_DETERMINISTIC, MODE_SAMPLING, PipelineProfiler
+
+CONF_BUCKET = "bucket"
+CONF_EXPORT = "export"
+CONF_FLEET = "fleet"
+CONF_HISTORY = "history"
+CONF_HISTORY_PERSIST = "history_persist"
+CONF_HISTORY_SIZE = "history_size"
+CONF_METRICS = "metrics"
 CONF_PRODUCT = "product"
+CONF_PROXY = "proxy"
+CONF_PROXY_HOST = "proxy_host"
+CONF_TRACE = "trace"
+CONF_TRACE_THRESHOLD = "trace_threshold"
+CONF_WORKERS = "workers"
+DATA_DHCP_HOSTS = "ecoflow_dhcp_hosts"
+DATA_FLEET = "ecoflow_fleet"
+DATA_METRICS = "ecoflow_metrics"
+DATA_PARKED = "ecoflow_parked"
+DATA_SHARDS = "ecoflow_shards"
 DISCONNECT_TIME = timedelta(seconds=15)
 DOMAIN = "ecoflow"
-
+FAILOVER_BACKOFF = 300
+FAILOVER_FAILURES = 30
+FAILOVER_SCAN_DOUBLINGS = 4
+EVENT_APPLY_PROFILE_RESULT = "ecoflow_apply_profile_result"
+EVENT_QUERY_RESULT = "ecoflow_query_result"
+HISTORY_SIZE = 36000
+PARK_TIME = timedelta(seconds=60)
+SERVICE_APPLY_PROFILE = "apply_profile"
+SERVICE_PROFILE = "profile"
+SERVICE_QUERY = "query"
+SNAPSHOT_DELAY = 60
+SNAPSHOT_VERSION = 1
+STALE_TIME = timedelta(minutes=5)
+
+_LOGGER = getLogger(__name__)
 _PLATFORMS = {
     Platform.BINARY_SENSOR,
     Platform.LIGHT,
@@ -30,42 +83,174 @@ _PLATFORMS = {
     Platform.SWITCH,
 }
 
-_T = TypeVar("_T")
-
+_APPLY_PROFILE_SCHEMA = vol.Schema({
+    vol.Required("settings"): SETTINGS_SCHEMA,
+    vol.Optional("device_id", default=[]): vol.All(cv.ensure_list, [str]),
+    vol.Optional("parallel", default=8): vol.All(vol.Coerce(int), vol.Range(min=1, max=64)),
+    vol.Optional("timeout", default=15): vol.All(vol.Coerce(float), vol.Range(min=1, max=300)),
+})
+
+_PROFILE_SCHEMA = vol.Schema({
+    vol.Optional("duration", default=10): vol.All(vol.Coerce(float), vol.Range(min=1, max=600)),
+    vol.Optional("mode", default=MODE_DETERMINISTIC): vol.In([MODE_DETERMINISTIC, MODE_SAMPLING]),
+    vol.Optional("interval", default=5): vol.All(vol.Coerce(float), vol.Range(min=1, max=1000)),
+})
+
+_QUERY_SCHEMA = vol.Schema({
+    vol.Required("device_id"): str,
+    vol.Required("field"): str,
+    vol.Optional("window", default=600): vol.All(vol.Coerce(float), vol.Range(min=1)),
+    vol.Optional("percentiles", default=[]): [vol.All(vol.Coerce(float), vol.Range(min=0, max=100))],
+})
+
+_FIRMWARE_LABELS = {
+    "wifi": "Wi-Fi",
+    "ac": "inverter",
+    "dc_in": "MPPT",
+    "battery": "BMS",
+}
 
-async def to_task(src: Observable[_T]):
-    return await src
+_T = TypeVar("_T")
 
 
-async def request(tcp: RxTcpAutoConnection, req: bytes, res: Observable[_T]) -> _T:
-    t = to_task(res.pipe(
-        ops.timeout(5, throw(TimeoutError())),
-        ops.first(),
-    ))
+async def request(tcp: RxTcpAutoConnection, req: bytes, res: Subject[_T]) -> _T:
+    t = first(res, 5)
     try:
-        tcp.write(req)
+        tcp.write(req, 5, PRIORITY_POLL, t)
     except BaseException as ex:
-        t.close()
+        t.cancel()
         raise ex
     return await t
 
 
-def select_bms(idx: int):
-    return compose(
-        ops.filter(lambda x: x[0] == idx),
-        ops.map(lambda x: cast(dict[str, Any], x[1])),
-    )
+def _encode(x):
+    if type(x) is timedelta:
+        return {"td": x.total_seconds()}
+    return x
+
+
+def _decode(x):
+    if type(x) is dict and "td" in x:
+        return timedelta(seconds=x["td"])
+    return x
+
+
+def _snapshot_store(hass: HomeAssistant, entry: ConfigEntry):
+    return Store(hass, SNAPSHOT_VERSION, f"{DOMAIN}.{entry.entry_id}")
+
+
+def _sw_version(firmware: dict[str, str]):
+    parts = [f"{label} {firmware[k]}" for (
+        k, label) in _FIRMWARE_LABELS.items() if k in firmware]
+    if parts:
+        return f'{firmware["pd"]} ({", ".join(parts)})'
+    return firmware["pd"]
+
+
+def signal_latest(entry_id: str):
+    return f"{DOMAIN}_latest_{entry_id}"
+
+
+def track_extra_packs(entry: ConfigEntry, client: "HassioEcoFlowClient", action: Callable[["BmsPack"], None]):
+    added = set[int]()
+
+    def attached(idx: int):
+        if idx != 0 and idx not in added:
+            added.add(idx)
+            action(client.pack(idx))
+    for pack in list(client.packs.values()):
+        if pack.attached:
+            attached(pack.idx)
+    entry.async_on_unload(client.pack_attached.subscribe(attached).dispose)
+
+
+class BmsPack:
+    attached = False
+    seen = 0.0
+
+    def __init__(self, idx: int, device_info: DeviceInfo):
+        self.idx = idx
+        self.device_info = device_info
+        self.received = ReplaySubject[dict[str, Any]](
+            DISCONNECT_TIME.total_seconds())
+        # Replayed like received, as health entities are added after the
+        # first frame and identical frames after it are skipped
+        self.health = ReplaySubject[dict[str, Any]](
+            DISCONNECT_TIME.total_seconds())
+        self.received.map(PackHealth().update).subscribe(
+            self.health.on_next, self.health.on_error, self.health.on_completed)
+
+
+class ParkedConnection:
+    def __init__(self, hass: HomeAssistant, tcp: RxTcpAutoConnection, info: receive.Serial):
+        self.tcp = tcp
+        self.info = info
+        self.chunks = deque[Optional[bytes]](maxlen=256)
+        self.__hass = hass
+        self.__sub = tcp.received.subscribe(self.chunks.append)
+        self.__expire = event.async_call_later(
+            hass, PARK_TIME, self.__expired)
+
+    def release(self):
+        self.__expire()
+        self.__sub.dispose()
+
+    def __expired(self, *args):
+        parked: dict = self.__hass.data[DATA_PARKED]
+        if parked.get(self.tcp.host) is self:
+            parked.pop(self.tcp.host)
+        self.__sub.dispose()
+        self.tcp.close()
+
+
+def park_connection(hass: HomeAssistant, tcp: RxTcpAutoConnection, info: receive.Serial):
+    parked = hass.data.setdefault(DATA_PARKED, dict[str, ParkedConnection]())
+    if old := parked.pop(tcp.host, None):
+        old.release()
+        old.tcp.close()
+    parked[tcp.host] = ParkedConnection(hass, tcp, info)
+
+
+def adopt_connection(hass: HomeAssistant, host: str) -> Optional[ParkedConnection]:
+    parked = hass.data.get(DATA_PARKED, {}).pop(host, None)
+    if parked:
+        parked.release()
+    return parked
 
 
 class HassioEcoFlowClient:
     __disconnected = None
     __extra_connected = False
-
-    def __init__(self, hass: HomeAssistant, entry: ConfigEntry):
-        self.tcp = RxTcpAutoConnection(entry.data[CONF_HOST], ef.PORT)
+    __save_pending = False
+    frames = 0
+    reconnects = 0
+    skipped = 0
+    stale = False
+    version = 0
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry, shards: Optional[ShardPool] = None, parked: Optional[ParkedConnection] = None, snapshot: Optional[dict[str, Any]] = None, history: Optional[History] = None):
         self.product: int = entry.data[CONF_PRODUCT]
+        self.capabilities = ef.get_capabilities(self.product)
         self.serial = entry.unique_id
+        self.__title = entry.title
         self.diagnostics = dict[str, dict[str, Any]]()
+        self.__snapshot = dict[str, Any]()
+        self.__store = _snapshot_store(hass, entry)
+        self.bucket: Optional[Subject[None]] = None
+        self.__bucket_timer = None
+        self.__exporter: Optional[TelemetryExporter] = None
+        self.__export_timer = None
+        self.proxy: Optional[MuxProxy] = None
+        self.fleet: Optional[Fleet] = None
+        self.metrics: bool = entry.options.get(CONF_METRICS, False)
+        self.tracer: Optional[Tracer] = None
+        self.options = dict(entry.options)
+        self.__failover: Optional[asyncio.Task] = None
+        self.__failover_at = 0.0
+        self.__scan_at = 0.0
+        self.__scan_misses = 0
+        self.history = history
+        self.__hass = hass
         dr = async_get_dr(hass)
 
         self.device_info_main = DeviceInfo(
@@ -77,71 +262,223 @@ class HassioEcoFlowClient:
             self.device_info_main["connections"] = {
                 (CONNECTION_NETWORK_MAC, mac),
             }
+        if parked:
+            self.device_info_main["model"] = ef.get_model_name(
+                self.product, parked.info["model"])
+
+        if shards:
+            self.tcp = shards.connect(
+                entry.data[CONF_HOST], ef.PORT, self.product)
+            self.received = self.tcp.received
+        else:
+            if parked:
+                self.tcp = parked.tcp
+            else:
+                self.tcp = RxTcpAutoConnection(
+                    entry.data[CONF_HOST], ef.PORT)
+            self.received = Subject[tuple[int, int, int, bytes]]()
+            if sample := entry.options.get(CONF_TRACE, 0):
+                tracer = self.tracer = Tracer(
+                    sample, entry.options.get(CONF_TRACE_THRESHOLD, 100) / 1000)
+
+                def on_frame(x: bytes):
+                    if tracer.sampled():
+                        t = perf_counter()
+                        packet = receive.decode_packet(x)
+                        tracer.begin(packet, self.tcp.received_at, t)
+                    else:
+                        packet = receive.decode_packet(x)
+                    self.received.on_next(packet)
+            else:
+                def on_frame(x: bytes):
+                    self.received.on_next(receive.decode_packet(x))
+            self.tcp.received.subscribe(
+                receive.merge_packet(on_frame),
+                self.received.on_error,
+                self.received.on_completed,
+            )
 
-        self.received = self.tcp.received.pipe(
-            receive.merge_packet(),
-            ops.map(receive.decode_packet),
-            ops.share(),
-        )
-        self.pd = self.received.pipe(
-            ops.filter(receive.is_pd),
-            ops.map(lambda x: receive.parse_pd(x[3], self.product)),
-            ops.multicast(subject=ReplaySubject(1, DISCONNECT_TIME)),
-            ops.ref_count(),
-        )
-        self.ems = self.received.pipe(
-            ops.filter(receive.is_ems),
-            ops.map(lambda x: receive.parse_ems(x[3], self.product)),
-            ops.multicast(subject=ReplaySubject(1, DISCONNECT_TIME)),
-            ops.ref_count(),
-        )
-        self.inverter = self.received.pipe(
-            ops.filter(receive.is_inverter),
-            ops.map(lambda x: receive.parse_inverter(x[3], self.product)),
-            ops.multicast(subject=ReplaySubject(1, DISCONNECT_TIME)),
-            ops.ref_count(),
-        )
-        self.mppt = self.received.pipe(
-            ops.filter(receive.is_mppt),
-            ops.map(lambda x: receive.parse_mppt(x[3], self.product)),
-            ops.multicast(subject=ReplaySubject(1, DISCONNECT_TIME)),
-            ops.ref_count(),
-        )
-        self.bms = self.received.pipe(
-            ops.filter(receive.is_bms),
-            ops.map(lambda x: receive.parse_bms(x[3], self.product)),
-            ops.multicast(subject=ReplaySubject(1, DISCONNECT_TIME)),
-            ops.ref_count(),
-        )
-
-        self.dc_in_current_config = self.received.pipe(
-            ops.filter(receive.is_dc_in_current_config),
-            ops.map(lambda x: receive.parse_dc_in_current_config(x[3])),
-        )
-        self.dc_in_type = self.received.pipe(
-            ops.filter(receive.is_dc_in_type),
-            ops.map(lambda x: receive.parse_dc_in_type(x[3])),
-        )
-        self.fan_auto = self.received.pipe(
-            ops.filter(receive.is_fan_auto),
-            ops.map(lambda x: receive.parse_fan_auto(x[3])),
-        )
-        self.lcd_timeout = self.received.pipe(
-            ops.filter(receive.is_lcd_timeout),
-            ops.map(lambda x: receive.parse_lcd_timeout(x[3])),
-        )
+        if (port := entry.options.get(CONF_PROXY, 0)) and not shards:
+            # Workers keep the raw stream to themselves
+            self.proxy = MuxProxy(
+                self.tcp, port, entry.options.get(CONF_PROXY_HOST, LOCALHOST))
+            hass.async_create_task(self.proxy.start())
+
+        messages = self.capabilities["messages"]
+        never = Subject[Any]()
+        routes = dict[tuple[int, int, int],
+                      tuple[Callable[[tuple], Any], Subject, str]]()
+        replays = dict[str, ReplaySubject]()
+        outputs = list[Subject]()
+        skippable = set[tuple[int, int, int]]()
+
+        def route(name: str, parse: Callable[[tuple], Any], replay=False):
+            if name not in messages:
+                return never
+            if replay:
+                out = replays[name] = ReplaySubject(
+                    DISCONNECT_TIME.total_seconds())
+            else:
+                out = Subject()
+            outputs.append(out)
+
+            for header in receive.MESSAGES[name]:
+                routes[header] = (parse, out, name)
+            return out
+
+        deriver = Deriver()
+
+        def derive(name: str, value: Any):
+            for stream in deriver.update(name, value[1] if name == "bms" else value):
+                # Parse the next frame even if unchanged, to refresh it
+                for header in receive.MESSAGES[stream]:
+                    payloads.pop(header, None)
+            return value
+
+        def state(name: str, parse: Callable[[bytes, int], Any]):
+            if shards:
+                # Workers deliver already parsed records
+                return route(name, lambda x: derive(name, x[3]), True)
+            if name in messages:
+                skippable.update(receive.MESSAGES[name])
+            return route(name, lambda x: derive(name, parse(x[3], self.product)), True)
+
+        self.pd = state("pd", receive.parse_pd)
+        self.ems = state("ems", receive.parse_ems)
+        self.inverter = state("inverter", receive.parse_inverter)
+        self.mppt = state("mppt", receive.parse_mppt)
+        self.bms = state("bms", receive.parse_bms)
+
+        self.packs = dict[int, BmsPack]()
+        self.pack_attached = Subject[int]()
+        self.pack_detached = Subject[int]()
+
+        def demux(x: tuple[int, dict[str, Any]]):
+            pack = self.pack(x[0])
+            pack.seen = monotonic()
+            pack.received.on_next(x[1])
+            if not pack.attached:
+                pack.attached = True
+                self.pack_attached.on_next(pack.idx)
+
+        def demux_error(ex: BaseException):
+            for pack in list(self.packs.values()):
+                pack.received.on_error(ex)
+
+        def demux_completed():
+            for pack in list(self.packs.values()):
+                pack.received.on_completed()
+        self.bms.subscribe(demux, demux_error, demux_completed)
+
+        self.dc_in_current_config = route(
+            "dc_in_current_config", lambda x: receive.parse_dc_in_current_config(x[3]))
+        self.dc_in_type = route(
+            "dc_in_type", lambda x: receive.parse_dc_in_type(x[3]))
+        self.fan_auto = route(
+            "fan_auto", lambda x: receive.parse_fan_auto(x[3]))
+        self.lcd_timeout = route(
+            "lcd_timeout", lambda x: receive.parse_lcd_timeout(x[3]))
+
+        bms_headers = receive.MESSAGES["bms"] if ef.is_delta(
+            self.product) else ()
+
+        def frame_key(x: tuple[int, int, int, Any]):
+            if x[0:3] in bms_headers:
+                return (*x[0:3], x[3][:1])
+            return x[0:3]
+
+        # Last payload, pack index, stream and parsed record per message and
+        # pack
+        payloads = dict[Any, tuple[bytes, Optional[int], str, Any]]()
+        # (stream, record, source) of skipped frames, so consumers that count
+        # samples still see every frame
+        self.repeated = Subject[tuple[str, Any, Subject]]()
+        all_bms_headers = receive.MESSAGES["bms"]
+
+        def unchanged(x: tuple[int, int, int, Any]):
+            if x[0:3] not in skippable:
+                return False
+            last = payloads.get(frame_key(x))
+            if last is None or last[0] != x[3]:
+                return False
+            pack = None
+            if last[1] is not None:
+                pack = self.packs.get(last[1])
+                if pack is None or not pack.attached:
+                    return False
+                pack.seen = monotonic()
+                pack.received.touch()
+                pack.health.touch()
+            out = routes[x[0:3]][1]
+            out.touch()
+            self.skipped += 1
+            self.repeated.on_next((last[2], last[3], out))
+            if pack:
+                self.repeated.on_next((last[2], last[3][1], pack.received))
+            return True
+
+        def remember(x: tuple[int, int, int, Any], r: tuple, value: Any):
+            if x[0:3] in skippable:
+                payloads[frame_key(x)] = (
+                    x[3], value[0] if x[0:3] in all_bms_headers else None,
+                    r[2], value)
+
+        def dispatch(x: tuple[int, int, int, Any]):
+            tracer = self.tracer
+            if unchanged(x):
+                if tracer and x is tracer.frame:
+                    tracer.frame = None
+            elif tracer and x is tracer.frame:
+                dispatch_traced(x, tracer)
+            elif r := routes.get(x[0:3]):
+                value = r[0](x)
+                remember(x, r, value)
+                r[1].on_next(value)
+
+        def dispatch_traced(x: tuple[int, int, int, Any], tracer: Tracer):
+            if (r := routes.get(x[0:3])) is None:
+                tracer.frame = None
+                return
+            tracer.stamp()
+            value = r[0](x)
+            remember(x, r, value)
+            tracer.stamp()
+            r[1].on_next(value)
+            tracer.end()
+
+        def dispatch_error(ex: BaseException):
+            for out in outputs:
+                out.on_error(ex)
+
+        def dispatch_completed():
+            for out in outputs:
+                out.on_completed()
+        # Coalesce bursts so only the newest frame per message and pack is
+        # dispatched once the loop gets to it
+        self.latest = LatestSubject[tuple[int, int, int, Any]](frame_key)
+        self.received.subscribe(
+            self.latest.on_next, self.latest.on_error, self.latest.on_completed)
+        self.latest.subscribe(dispatch, dispatch_error, dispatch_completed)
 
         self.disconnected = Subject[Optional[int]]()
 
         def _disconnected(*args):
             self.__disconnected = None
             self.tcp.reconnect()
+            self.reconnects += 1
             self.diagnostics.clear()
+            payloads.clear()
+            self.version += 1
             self.disconnected.on_next(None)
+            for pack in list(self.packs.values()):
+                if pack.attached:
+                    self.__detach(pack)
             if self.__extra_connected:
                 self.__extra_connected = False
 
         def reset_timer(*args):
+            self.frames += 1
+            self.stale = False
             if self.__disconnected:
                 self.__disconnected()
             self.__disconnected = event.async_track_point_in_utc_time(
@@ -158,13 +495,74 @@ class HassioEcoFlowClient:
                 self.disconnected.on_completed()
         self.received.subscribe(reset_timer, end_timer, end_timer)
 
+        def check_packs(now):
+            if self.stale:
+                return
+            limit = monotonic() - DISCONNECT_TIME.total_seconds()
+            for pack in list(self.packs.values()):
+                if pack.attached and pack.seen < limit:
+                    self.__detach(pack)
+        self.__pack_timer = event.async_track_time_interval(
+            hass, check_packs, DISCONNECT_TIME)
+
+        def check_host(now):
+            if self.tcp.failures < FAILOVER_FAILURES:
+                return
+            if self.__failover and not self.__failover.done():
+                return
+            if monotonic() - self.__failover_at < FAILOVER_BACKOFF:
+                return
+            self.__failover_at = monotonic()
+            self.__failover = hass.async_create_task(
+                self.__resolve_host(hass, entry))
+        self.__host_timer = None
+        if not shards and entry.data.get(CONF_MAC):
+            # Workers shard by host, so only in-process connections move
+            self.__host_timer = event.async_track_time_interval(
+                hass, check_host, DISCONNECT_TIME)
+
+        if bucket := entry.options.get(CONF_BUCKET, 0):
+            self.bucket = Subject[None]()
+            self.__bucket_timer = event.async_track_time_interval(
+                hass,
+                lambda now: self.bucket.on_next(None),
+                timedelta(seconds=bucket),
+            )
+            signal = signal_latest(entry.entry_id)
+
+            def publish_latest(name: str):
+                return lambda data: async_dispatcher_send(hass, signal, name, data)
+            self.pd.subscribe(publish_latest("pd"))
+            self.ems.subscribe(publish_latest("ems"))
+            self.inverter.subscribe(publish_latest("inverter"))
+            self.mppt.subscribe(publish_latest("mppt"))
+            self.bms.subscribe(publish_latest("bms"))
+
+        # Registry entries are only written when model or firmware change
+        firmware = dict[str, str]()
+
+        def sync_device(info: DeviceInfo, changes: dict[str, Any]):
+            if all(info.get(k) == v for (k, v) in changes.items()):
+                return
+            info.update(changes)
+            dr.async_get_or_create(config_entry_id=entry.entry_id, **info)
+
+        def sync_main(model: Optional[str] = None, **versions: Optional[str]):
+            firmware.update((k, v) for (k, v) in versions.items() if v)
+            changes = dict[str, Any]()
+            if model is not None:
+                changes["model"] = model
+            if "pd" in firmware:
+                changes["sw_version"] = _sw_version(firmware)
+            sync_device(self.device_info_main, changes)
+
         def pd_updated(data: dict[str, Any]):
             self.diagnostics["pd"] = data
-            self.device_info_main["model"] = ef.get_model_name(
-                self.product, data["model"])
-            dr.async_get_or_create(
-                config_entry_id=entry.entry_id,
-                **self.device_info_main,
+            self.__save("pd", data)
+            sync_main(
+                ef.get_model_name(self.product, data["model"]),
+                pd=data.get("pd_version"),
+                wifi=data.get("wifi_version"),
             )
             if self.__extra_connected != ef.has_extra(self.product, data.get("model", None)):
                 self.__extra_connected = not self.__extra_connected
@@ -176,23 +574,186 @@ class HassioEcoFlowClient:
             if "bms" not in self.diagnostics:
                 self.diagnostics["bms"] = dict[str, Any]()
             self.diagnostics["bms"][data[0]] = data[1]
+            if version := data[1].get("battery_version"):
+                if data[0]:
+                    sync_device(self.pack(data[0]).device_info,
+                                {"sw_version": version})
+                else:
+                    sync_main(battery=version)
+            self.__save("bms", {
+                **self.__snapshot.get("bms", {}),
+                str(data[0]): data[1],
+            })
         self.bms.subscribe(bms_updated)
 
         def ems_updated(data: dict[str, Any]):
             self.diagnostics["ems"] = data
+            self.__save("ems", data)
+            sync_main(battery=data.get("battery_main_version"))
         self.ems.subscribe(ems_updated)
 
         def inverter_updated(data: dict[str, Any]):
             self.diagnostics["inverter"] = data
+            self.__save("inverter", data)
+            sync_main(ac=data.get("ac_version"))
         self.inverter.subscribe(inverter_updated)
 
         def mppt_updated(data: dict[str, Any]):
             self.diagnostics["mppt"] = data
+            self.__save("mppt", data)
+            sync_main(dc_in=data.get("dc_in_version"))
         self.mppt.subscribe(mppt_updated)
 
+        seeding = False
+        sinks = list[Callable[[str, Any], None]]()
+        if days := entry.options.get(CONF_EXPORT, 0):
+            self.__exporter = TelemetryExporter(
+                hass.config.path(EXPORT_DIR, self.serial), self.product, days)
+            sinks.append(self.__exporter.append)
+            self.__export_timer = event.async_track_time_interval(
+                hass,
+                lambda now: self.__exporter.flush_idle(),
+                timedelta(seconds=FLUSH_INTERVAL),
+            )
+        if history:
+            sinks.append(history.append)
+        if sinks:
+            def record(name: str):
+                def f(data):
+                    if not seeding:
+                        for sink in sinks:
+                            sink(name, data)
+                return f
+            recorders = {
+                self.pd: record("pd"),
+                self.ems: record("ems"),
+                self.inverter: record("inverter"),
+                self.mppt: record("mppt"),
+                self.bms: record("bms"),
+            }
+            for (src, f) in recorders.items():
+                src.subscribe(f)
+
+            def repeated(x: tuple[str, Any, Subject]):
+                if f := recorders.get(x[2]):
+                    f(x[1])
+            self.repeated.subscribe(repeated)
+
+        if snapshot:
+            seeding = True
+            self.stale = True
+            self.__disconnected = event.async_call_later(
+                hass, STALE_TIME, _disconnected)
+            for name in ("pd", "ems", "inverter", "mppt"):
+                if name in snapshot and name in replays:
+                    replays[name].on_next(
+                        {k: _decode(v) for (k, v) in snapshot[name].items()})
+            if "bms" in replays:
+                for (idx, data) in snapshot.get("bms", {}).items():
+                    replays["bms"].on_next(
+                        (int(idx), {k: _decode(v) for (k, v) in data.items()}))
+            seeding = False
+
+        if parked:
+            for chunk in parked.chunks:
+                self.tcp.received.on_next(chunk)
+
+    def pack(self, idx: int):
+        if (pack := self.packs.get(idx)) is None:
+            info = self.device_info_main
+            if idx:
+                info = DeviceInfo(
+                    identifiers={(DOMAIN, f"{self.serial}-{idx}")},
+                    manufacturer="EcoFlow",
+                    name=f"{self.__title} battery {idx}",
+                    via_device=(DOMAIN, self.serial),
+                )
+            pack = self.packs[idx] = BmsPack(idx, info)
+        return pack
+
+    def __detach(self, pack: BmsPack):
+        pack.attached = False
+        pack.received.clear()
+        pack.health.clear()
+        self.pack_detached.on_next(pack.idx)
+        if pack.idx:
+            self.disconnected.on_next(pack.idx)
+
+    async def __resolve_host(self, hass: HomeAssistant, entry: ConfigEntry):
+        old = self.tcp.host
+        mac = format_mac(entry.data[CONF_MAC])
+        neighbours = await hass.async_add_executor_job(discovery.read_neighbours)
+        # Addresses DHCP discovery or the ARP table last saw for the MAC
+        known = {
+            hass.data.get(DATA_DHCP_HOSTS, {}).get(mac),
+            neighbours.get(mac),
+        } - {None, old}
+        host = None
+        if known:
+            host = await discovery.find_station(known, self.serial)
+        if host is None and monotonic() >= self.__scan_at:
+            host = await discovery.find_station(
+                discovery.subnet_hosts(old), self.serial)
+            if host is None:
+                # Probing the whole subnet is expensive, so back off
+                self.__scan_misses += 1
+                self.__scan_at = monotonic() + FAILOVER_BACKOFF * 2 ** min(
+                    self.__scan_misses, FAILOVER_SCAN_DOUBLINGS)
+        if host is None:
+            _LOGGER.debug(f"{self.serial} not found near {old}")
+            return
+        self.__scan_at = 0.0
+        self.__scan_misses = 0
+        _LOGGER.info(f"{self.serial} moved from {old} to {host}")
+        self.tcp.host = host
+        hass.config_entries.async_update_entry(
+            entry, data={**entry.data, CONF_HOST: host})
+
+    @property
+    def connected(self):
+        return self.__disconnected is not None and not self.stale
+
+    def __save(self, name: str, data: Any):
+        self.version += 1
+        self.__snapshot[name] = data
+        if self.stale or self.__save_pending:
+            return
+        self.__save_pending = True
+        self.__store.async_delay_save(self.__snapshot_data, SNAPSHOT_DELAY)
+
+    def __snapshot_data(self):
+        self.__save_pending = False
+        res = dict[str, Any]()
+        for (name, data) in self.__snapshot.items():
+            if name == "bms":
+                res[name] = {
+                    idx: {k: _encode(v) for (k, v) in d.items()} for (idx, d) in data.items()
+                }
+            else:
+                res[name] = {k: _encode(v) for (k, v) in data.items()}
+        return res
+
     async def close(self):
+        self.__pack_timer()
+        if self.__host_timer:
+            self.__host_timer()
+        if self.__failover:
+            self.__failover.cancel()
+        if self.__bucket_timer:
+            self.__bucket_timer()
+        if self.fleet:
+            self.fleet.leave(self.serial)
+        if self.proxy:
+            await self.proxy.close()
         self.tcp.close()
         await self.tcp.wait_closed()
+        if self.__export_timer:
+            self.__export_timer()
+        if self.__exporter:
+            self.__exporter.close()
+            await self.__hass.async_add_executor_job(self.__exporter.join)
+        if self.history:
+            await self.__hass.async_add_executor_job(self.history.flush)
 
 
 class EcoFlowBaseEntity(Entity):
@@ -200,11 +761,18 @@ class EcoFlowBaseEntity(Entity):
     _attr_should_poll = False
     _connected = False
 
+    @property
+    def assumed_state(self):
+        return self._client.stale
+
     def __init__(self, client: HassioEcoFlowClient, bms_id: Optional[int] = None):
         self._attr_available = False
         self._client = client
         self._bms_id = bms_id or 0
-        self._attr_device_info = client.device_info_main
+        if bms_id:
+            self._attr_device_info = client.pack(bms_id).device_info
+        else:
+            self._attr_device_info = client.device_info_main
         self._attr_unique_id = client.serial
         if bms_id:
             self._attr_unique_id += f"-{bms_id}"
@@ -213,9 +781,16 @@ class EcoFlowBaseEntity(Entity):
         await super().async_added_to_hass()
         self._subscribe(self._client.disconnected, self.__on_disconnected)
 
-    def _subscribe(self, src: Observable, func: Callable):
+    def _subscribe(self, src: Subject, func: Callable):
         self.async_on_remove(src.subscribe(func).dispose)
 
+    def _write(self, data: bytes):
+        # Service calls from the UI carry the user, automations don't
+        if self._context and self._context.user_id:
+            self._client.tcp.write(data, priority=PRIORITY_INTERACTIVE)
+        else:
+            self._client.tcp.write(data, priority=PRIORITY_AUTOMATION)
+
     def __on_disconnected(self, bms_id: Optional[int]):
         if bms_id is not None and self._bms_id != bms_id:
             return
@@ -226,7 +801,7 @@ class EcoFlowBaseEntity(Entity):
 
 
 class EcoFlowEntity(EcoFlowBaseEntity):
-    def __init__(self, client: HassioEcoFlowClient, src: Observable[dict[str, Any]], key: str, name: str, bms_id: Optional[int] = None):
+    def __init__(self, client: HassioEcoFlowClient, src: Subject[dict[str, Any]], key: str, name: str, bms_id: Optional[int] = None):
         super().__init__(client, bms_id)
         self._key = key
         self._src = src
@@ -238,13 +813,18 @@ class EcoFlowEntity(EcoFlowBaseEntity):
         self._subscribe(self._src, self.__updated)
 
     def __updated(self, data: dict[str, Any]):
+        if tracer := self._client.tracer:
+            tracer.written()
         self._attr_available = True
         self._on_updated(data)
-        self.async_write_ha_state()
+        self._publish()
 
     def _on_updated(self, data: dict[str, Any]):
         pass
 
+    def _publish(self):
+        self.async_write_ha_state()
+
 
 class EcoFlowConfigEntity(EcoFlowBaseEntity):
     _attr_entity_category = EntityCategory.CONFIG
@@ -269,10 +849,41 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     if DOMAIN not in hass.data:
         hass.data[DOMAIN] = {}
 
-    client = HassioEcoFlowClient(hass, entry)
+    shards = None
+    snapshot = await _snapshot_store(hass, entry).async_load()
+    if entry.options.get(CONF_WORKERS, False):
+        shards = await _async_get_shards(hass)
+    history = None
+    if fields := parse_fields(entry.options.get(CONF_HISTORY, "")):
+        history = await hass.async_add_executor_job(
+            History,
+            fields,
+            entry.options.get(CONF_HISTORY_SIZE, HISTORY_SIZE),
+            _history_path(hass, entry) if entry.options.get(
+                CONF_HISTORY_PERSIST, False) else None,
+        )
+    # Adopt only once nothing awaits before the client subscribes, so no
+    # chunk is lost in between
+    parked = adopt_connection(hass, entry.data[CONF_HOST])
+    if parked and shards:
+        parked.tcp.close()
+        parked = None
+    client = HassioEcoFlowClient(
+        hass, entry, shards, parked, snapshot, history)
 
     hass.data[DOMAIN][entry.entry_id] = client
+    if entry.options.get(CONF_FLEET, False):
+        if DATA_FLEET not in hass.data:
+            hass.data[DATA_FLEET] = Fleet(hass)
+        client.fleet = hass.data[DATA_FLEET]
+        client.fleet.join(client)
+    if client.metrics and DATA_METRICS not in hass.data:
+        hass.data[DATA_METRICS] = MetricsView(
+            lambda: [x for x in hass.data[DOMAIN].values() if x.metrics])
+        hass.http.register_view(hass.data[DATA_METRICS])
     hass.config_entries.async_setup_platforms(entry, _PLATFORMS)
+    entry.async_on_unload(entry.add_update_listener(_async_update_listener))
+    _async_setup_services(hass)
     return True
 
 
@@ -282,4 +893,107 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
 
     client: HassioEcoFlowClient = hass.data[DOMAIN].pop(entry.entry_id)
     await client.close()
+    # A pool still starting belongs to an entry that is being set up
+    if (task := hass.data.get(DATA_SHARDS)) and task.done():
+        if task.cancelled() or task.exception():
+            # Never started, so there is nothing to stop
+            hass.data.pop(DATA_SHARDS)
+        elif (shards := task.result()).empty:
+            hass.data.pop(DATA_SHARDS)
+            shards.detach()
+            await hass.async_add_executor_job(shards.stop)
+    if client.fleet and client.fleet.empty:
+        hass.data.pop(DATA_FLEET)
+    if not hass.data[DOMAIN]:
+        hass.services.async_remove(DOMAIN, SERVICE_APPLY_PROFILE)
+        hass.services.async_remove(DOMAIN, SERVICE_PROFILE)
+        hass.services.async_remove(DOMAIN, SERVICE_QUERY)
     return True
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry):
+    await _snapshot_store(hass, entry).async_remove()
+    await hass.async_add_executor_job(
+        shutil.rmtree, _history_path(hass, entry), True)
+
+
+def _history_path(hass: HomeAssistant, entry: ConfigEntry):
+    return hass.config.path(HISTORY_DIR, entry.entry_id)
+
+
+async def _async_get_shards(hass: HomeAssistant) -> ShardPool:
+    if DATA_SHARDS not in hass.data:
+        hass.data[DATA_SHARDS] = hass.async_create_task(
+            _async_start_shards(hass))
+    return await hass.data[DATA_SHARDS]
+
+
+async def _async_start_shards(hass: HomeAssistant):
+    shards = ShardPool(min(4, os.cpu_count() or 1))
+    await hass.async_add_executor_job(shards.start)
+    await shards.attach()
+    return shards
+
+
+async def _async_update_listener(hass: HomeAssistant, entry: ConfigEntry):
+    client: Optional[HassioEcoFlowClient] = hass.data[DOMAIN].get(
+        entry.entry_id)
+    if client and client.options == entry.options:
+        # Host changes from failover are applied in place
+        return
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
+def _async_setup_services(hass: HomeAssistant):
+    if hass.services.has_service(DOMAIN, SERVICE_PROFILE):
+        return
+    profiler = PipelineProfiler(hass)
+
+    async def profile(call: ServiceCall):
+        profiler.start(
+            call.data["duration"],
+            call.data["mode"],
+            call.data["interval"] / 1000,
+        )
+    hass.services.async_register(
+        DOMAIN, SERVICE_PROFILE, profile, _PROFILE_SCHEMA)
+
+    def get_client(device_id: str) -> HassioEcoFlowClient:
+        device = async_get_dr(hass).async_get(device_id)
+        client: Optional[HassioEcoFlowClient] = None
+        for entry_id in device.config_entries if device else ():
+            client = hass.data[DOMAIN].get(entry_id, client)
+        if client is None:
+            raise HomeAssistantError("Unknown EcoFlow device")
+        return client
+
+    async def query(call: ServiceCall):
+        client = get_client(call.data["device_id"])
+        field = call.data["field"]
+        if not client.history or field not in client.history.buffers:
+            raise HomeAssistantError(f"{field} is not recorded")
+        hass.bus.async_fire(EVENT_QUERY_RESULT, {
+            "device_id": call.data["device_id"],
+            "field": field,
+            "window": call.data["window"],
+            **client.history.query(field, call.data["window"], call.data["percentiles"]),
+        })
+    hass.services.async_register(DOMAIN, SERVICE_QUERY, query, _QUERY_SCHEMA)
+
+    async def apply(call: ServiceCall):
+        if call.data["device_id"]:
+            clients = [get_client(x) for x in call.data["device_id"]]
+        else:
+            clients = list(hass.data[DOMAIN].values())
+        results = await apply_profile(
+            clients,
+            call.data["settings"],
+            call.data["parallel"],
+            call.data["timeout"],
+        )
+        hass.bus.async_fire(EVENT_APPLY_PROFILE_RESULT, {
+            "settings": call.data["settings"],
+            "results": results,
+        })
+    hass.services.async_register(
+        DOMAIN, SERVICE_APPLY_PROFILE, apply, _APPLY_PROFILE_SCHEMA)
@@ -1,47 +1,211 @@
-import reactivex.operators as ops
+import asyncio
+import re
+from ipaddress import ip_network
+from time import monotonic
+from typing import Optional
+
 import voluptuous as vol
 from homeassistant.components.dhcp import DhcpServiceInfo
-from homeassistant.config_entries import ConfigFlow
+from homeassistant.config_entries import (SOURCE_IMPORT, ConfigEntry,
+                                          ConfigFlow, OptionsFlow)
 from homeassistant.const import CONF_HOST, CONF_MAC
+from homeassistant.core import callback
+from homeassistant.data_entry_flow import AbortFlow
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.device_registry import format_mac
 
-from . import CONF_PRODUCT, DOMAIN, request
+from . import (CONF_BUCKET, CONF_EXPORT, CONF_FLEET, CONF_HISTORY,
+               CONF_HISTORY_PERSIST, CONF_HISTORY_SIZE, CONF_METRICS,
+               CONF_PRODUCT, CONF_PROXY, CONF_PROXY_HOST, CONF_TRACE,
+               CONF_TRACE_THRESHOLD, CONF_WORKERS, DATA_DHCP_HOSTS, DOMAIN,
+               HISTORY_SIZE, park_connection, request)
 from .ecoflow import PORT, PRODUCTS, receive, send
+from .ecoflow.discovery import PROBE_PARALLEL, probe
+from .ecoflow.proxy import LOCALHOST
 from .ecoflow.rxtcp import RxTcpAutoConnection
+from .ecoflow.stream import Subject
+from .history import parse_fields
+
+CONF_SERIALS = "serials"
+DATA_DHCP = "ecoflow_dhcp"
+DHCP_PROBE_INTERVAL = 600
+PROBE_MAX_HOSTS = 1024
+
+
+def _parse_hosts(value: str):
+    hosts = list[str]()
+    for token in re.split(r"[\s,;]+", value.strip()):
+        if not token:
+            continue
+        if "/" not in token:
+            hosts.append(token)
+            continue
+        net = ip_network(token, strict=False)
+        if net.num_addresses > PROBE_MAX_HOSTS:
+            raise ValueError(token)
+        if net.num_addresses == 1:
+            hosts.append(str(net.network_address))
+        else:
+            hosts.extend(str(x) for x in net.hosts())
+    if len(hosts) > PROBE_MAX_HOSTS:
+        raise ValueError(value)
+    return hosts
+
+
+def _title(info: receive.Serial):
+    pn = PRODUCTS.get(info["product"], "")
+    if pn != "":
+        pn += " "
+    return f'{pn}{info["serial"][-6:]}'
 
 
 class EcoflowConfigFlow(ConfigFlow, domain=DOMAIN):
     VERSION = 1
     host = None
     mac = None
+    discovered: dict[str, tuple[str, receive.Serial]] = None
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: ConfigEntry):
+        return EcoflowOptionsFlow(config_entry)
 
-    async def _get_serial_main(self):
+    async def _get_serial_main(self, park: bool):
         tcp = RxTcpAutoConnection(self.host, PORT)
-        received = tcp.received.pipe(
-            receive.merge_packet(),
-            ops.map(receive.decode_packet),
-            ops.filter(receive.is_serial_main),
-            ops.map(lambda x: receive.parse_serial(x[3])),
-        )
+        received = Subject[receive.Serial]()
+
+        def packet(x: bytes):
+            x = receive.decode_packet(x)
+            if receive.is_serial_main(x):
+                received.on_next(receive.parse_serial(x[3]))
+        sub = tcp.received.subscribe(receive.merge_packet(packet))
         try:
             await tcp.wait_opened()
             info = await request(tcp, send.get_serial_main(), received)
-        finally:
+        except BaseException:
             tcp.close()
+            raise
+        finally:
+            sub.dispose()
         if info["product"] not in PRODUCTS:
+            tcp.close()
             return self.async_abort(reason="product_unsupported", description_placeholders={"product": info["product"]})
         await self.async_set_unique_id(info["serial"])
-        self._abort_if_unique_id_configured(updates={
-            CONF_HOST: self.host,
-            CONF_MAC: self.mac,
-        })
+        try:
+            self._abort_if_unique_id_configured(updates={
+                CONF_HOST: self.host,
+                CONF_MAC: self.mac,
+            })
+        except AbortFlow:
+            # Wi-Fi modules accept only a few connections
+            tcp.close()
+            raise
+        if park:
+            park_connection(self.hass, tcp, info)
+        else:
+            tcp.close()
         return info
 
     async def async_step_dhcp(self, discovery_info: DhcpServiceInfo):
         self.host = discovery_info.ip
         self.mac = discovery_info.macaddress
-        await self._get_serial_main()
+        mac = format_mac(self.mac)
+        # Lets failover find a station that moved without scanning
+        self.hass.data.setdefault(DATA_DHCP_HOSTS, {})[mac] = self.host
+        updates = {CONF_HOST: self.host, CONF_MAC: self.mac}
+        for entry in self._async_current_entries(include_ignore=False):
+            if (known := entry.data.get(CONF_MAC)) and format_mac(known) == mac:
+                await self.async_set_unique_id(entry.unique_id)
+                self._abort_if_unique_id_configured(updates=updates)
+
+        # MAC -> (last probe, serial or None if the probe failed)
+        cache: dict[str, tuple[float, Optional[str]]] = self.hass.data.setdefault(
+            DATA_DHCP, {})
+        if cached := cache.get(mac):
+            if cached[1] is not None:
+                await self.async_set_unique_id(cached[1])
+                self._abort_if_unique_id_configured(updates=updates)
+                return self.async_show_form(step_id="user")
+            if monotonic() - cached[0] < DHCP_PROBE_INTERVAL:
+                return self.async_abort(reason="probe_rate_limited")
+
+        cache[mac] = (monotonic(), None)
+        try:
+            # The confirmation form may never be submitted
+            res = await self._get_serial_main(False)
+        except TimeoutError:
+            return self.async_abort(reason="timeout")
+        if "serial" not in res:
+            return res
+        cache[mac] = (monotonic(), res["serial"])
         return self.async_show_form(step_id="user")
 
+    async def _discover(self, hosts: list[str]):
+        sem = asyncio.Semaphore(PROBE_PARALLEL)
+        results = await asyncio.gather(*(probe(x, sem) for x in hosts))
+        configured = self._async_current_ids()
+        self.discovered = {}
+        for (host, info) in zip(hosts, results):
+            if info is None or info["product"] not in PRODUCTS:
+                continue
+            if info["serial"] in configured:
+                continue
+            self.discovered[info["serial"]] = (host, info)
+
+    async def async_step_import(self, user_input: dict):
+        await self.async_set_unique_id(user_input["serial"])
+        self._abort_if_unique_id_configured(updates={
+            CONF_HOST: user_input[CONF_HOST],
+        })
+        return self.async_create_entry(
+            title=user_input["title"],
+            data={
+                CONF_HOST: user_input[CONF_HOST],
+                CONF_MAC: None,
+                CONF_PRODUCT: user_input[CONF_PRODUCT],
+            },
+        )
+
+    async def async_step_select(self, user_input: dict = None):
+        if user_input is not None:
+            serials: list[str] = user_input[CONF_SERIALS]
+            if not serials:
+                return self.async_abort(reason="no_devices_found")
+            for serial in serials[1:]:
+                (host, info) = self.discovered[serial]
+                self.hass.async_create_task(self.hass.config_entries.flow.async_init(
+                    DOMAIN,
+                    context={"source": SOURCE_IMPORT},
+                    data={
+                        "serial": serial,
+                        "title": _title(info),
+                        CONF_HOST: host,
+                        CONF_PRODUCT: info["product"],
+                    },
+                ))
+            (self.host, info) = self.discovered[serials[0]]
+            await self.async_set_unique_id(serials[0])
+            self._abort_if_unique_id_configured()
+            return self.async_create_entry(
+                title=_title(info),
+                data={
+                    CONF_HOST: self.host,
+                    CONF_MAC: None,
+                    CONF_PRODUCT: info["product"],
+                },
+            )
+
+        options = {
+            serial: f"{_title(info)} ({host})" for (serial, (host, info)) in self.discovered.items()
+        }
+        return self.async_show_form(
+            step_id="select",
+            data_schema=vol.Schema({
+                vol.Required(CONF_SERIALS, default=list(options)): cv.multi_select(options),
+            }),
+            last_step=True,
+        )
+
     async def async_step_user(self, user_input: dict = None):
         if user_input:
             self.host = user_input.get(CONF_HOST)
@@ -49,21 +213,29 @@ class EcoflowConfigFlow(ConfigFlow, domain=DOMAIN):
         errors = {}
         if self.host and user_input is not None:
             try:
-                info = await self._get_serial_main()
-            except TimeoutError:
-                errors["base"] = "timeout"
+                hosts = _parse_hosts(self.host)
+            except ValueError:
+                errors["base"] = "invalid_hosts"
             else:
-                pn = PRODUCTS.get(info["product"], "")
-                if pn != "":
-                    pn += " "
-                return self.async_create_entry(
-                    title=f'{pn}{info["serial"][-6:]}',
-                    data={
-                        CONF_HOST: self.host,
-                        CONF_MAC: self.mac,
-                        CONF_PRODUCT: info["product"],
-                    },
-                )
+                if len(hosts) > 1 or "/" in self.host:
+                    await self._discover(hosts)
+                    if self.discovered:
+                        return await self.async_step_select()
+                    errors["base"] = "no_devices_found"
+                else:
+                    try:
+                        info = await self._get_serial_main(True)
+                    except TimeoutError:
+                        errors["base"] = "timeout"
+                    else:
+                        return self.async_create_entry(
+                            title=_title(info),
+                            data={
+                                CONF_HOST: self.host,
+                                CONF_MAC: self.mac,
+                                CONF_PRODUCT: info["product"],
+                            },
+                        )
 
         return self.async_show_form(
             step_id="user",
@@ -73,3 +245,38 @@ class EcoflowConfigFlow(ConfigFlow, domain=DOMAIN):
             }),
             last_step=True,
         )
+
+
+class EcoflowOptionsFlow(OptionsFlow):
+    def __init__(self, config_entry: ConfigEntry):
+        self.config_entry = config_entry
+
+    async def async_step_init(self, user_input: dict = None):
+        errors = {}
+        if user_input is not None:
+            try:
+                parse_fields(user_input[CONF_HISTORY])
+            except ValueError:
+                errors["base"] = "invalid_history"
+            else:
+                return self.async_create_entry(title="", data=user_input)
+
+        options = user_input or self.config_entry.options
+        return self.async_show_form(
+            step_id="init",
+            errors=errors,
+            data_schema=vol.Schema({
+                vol.Required(CONF_BUCKET, default=options.get(CONF_BUCKET, 0)): vol.All(vol.Coerce(int), vol.Range(min=0, max=3600)),
+                vol.Required(CONF_WORKERS, default=options.get(CONF_WORKERS, False)): bool,
+                vol.Required(CONF_EXPORT, default=options.get(CONF_EXPORT, 0)): vol.All(vol.Coerce(int), vol.Range(min=0, max=3650)),
+                vol.Optional(CONF_HISTORY, default=options.get(CONF_HISTORY, "")): str,
+                vol.Required(CONF_HISTORY_SIZE, default=options.get(CONF_HISTORY_SIZE, HISTORY_SIZE)): vol.All(vol.Coerce(int), vol.Range(min=60, max=10000000)),
+                vol.Required(CONF_HISTORY_PERSIST, default=options.get(CONF_HISTORY_PERSIST, False)): bool,
+                vol.Required(CONF_PROXY, default=options.get(CONF_PROXY, 0)): vol.All(vol.Coerce(int), vol.Range(min=0, max=65535)),
+                vol.Required(CONF_PROXY_HOST, default=options.get(CONF_PROXY_HOST, LOCALHOST)): str,
+                vol.Required(CONF_METRICS, default=options.get(CONF_METRICS, False)): bool,
+                vol.Required(CONF_FLEET, default=options.get(CONF_FLEET, False)): bool,
+                vol.Required(CONF_TRACE, default=options.get(CONF_TRACE, 0)): vol.All(vol.Coerce(int), vol.Range(min=0, max=100000)),
+                vol.Required(CONF_TRACE_THRESHOLD, default=options.get(CONF_TRACE_THRESHOLD, 100)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            }),
+        )
@@ -21,4 +21,11 @@ async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigE
     for i in client.diagnostics:
         d = client.diagnostics[i]
         values[i] = _to_serializable(d)
+    values["pipeline"] = {
+        "dropped_frames": client.latest.dropped,
+        "skipped_frames": client.skipped,
+        "dropped_commands": client.tcp.dropped,
+    }
+    if client.tracer:
+        values["trace"] = client.tracer.as_dict()
     return values
@@ -1,3 +1,5 @@
+from typing import TypedDict
+
 PORT = 8055
 PRODUCTS = {
     5: "RIVER",
@@ -11,6 +13,47 @@ PRODUCTS = {
     20: "Smart Generator",
 }
 
+
+class Capabilities(TypedDict):
+    messages: frozenset[str]
+    commands: frozenset[str]
+
+
+_DELTA_MESSAGES = frozenset({
+    "pd", "ems", "inverter", "mppt", "bms", "dc_in_current_config",
+})
+_DELTA_COMMANDS = frozenset({
+    "ac_freq", "ac_in_limit", "ac_out", "ac_timeout", "beep", "dc_in_current",
+    "dc_out", "lcd", "level_max", "level_min", "standby_timeout", "xboost",
+})
+_RIVER_MESSAGES = frozenset({
+    "pd", "ems", "inverter", "bms", "dc_in_current_config", "dc_in_type",
+    "fan_auto", "lcd_timeout",
+})
+_RIVER_COMMANDS = frozenset({
+    "ac_freq", "ac_in_slow", "ac_out", "ac_timeout", "beep", "dc_in_current",
+    "dc_in_type", "dc_out", "fan_auto", "lcd", "level_max", "light",
+    "standby_timeout", "xboost",
+})
+
+CAPABILITIES: dict[int, Capabilities] = {
+    5: Capabilities(messages=_RIVER_MESSAGES, commands=_RIVER_COMMANDS | {"ambient"}),
+    7: Capabilities(messages=_RIVER_MESSAGES, commands=_RIVER_COMMANDS),
+    12: Capabilities(messages=_RIVER_MESSAGES, commands=_RIVER_COMMANDS),
+    13: Capabilities(messages=_DELTA_MESSAGES, commands=_DELTA_COMMANDS),
+    14: Capabilities(messages=_DELTA_MESSAGES, commands=_DELTA_COMMANDS | {"generate"}),
+    15: Capabilities(messages=_DELTA_MESSAGES, commands=_DELTA_COMMANDS),
+    17: Capabilities(
+        messages=frozenset({"pd", "ems", "inverter", "dc_in_current_config"}),
+        commands=frozenset({
+            "ac_freq", "ac_out", "ac_timeout", "beep", "dc_in_current",
+            "level_max", "standby_timeout",
+        }),
+    ),
+    18: Capabilities(messages=_RIVER_MESSAGES, commands=_RIVER_COMMANDS),
+}
+_NO_CAPABILITIES = Capabilities(messages=frozenset(), commands=frozenset())
+
 _crc8_tab = [0, 7, 14, 9, 28, 27, 18, 21, 56, 63, 54, 49, 36, 35, 42, 45, 112, 119, 126, 121, 108, 107, 98, 101, 72, 79, 70, 65, 84, 83, 90, 93, 224, 231, 238, 233, 252, 251, 242, 245, 216, 223, 214, 209, 196, 195, 202, 205, 144, 151, 158, 153, 140, 139, 130, 133, 168, 175, 166, 161, 180, 179, 186, 189, 199, 192, 201, 206, 219, 220, 213, 210, 255, 248, 241, 246, 227, 228, 237, 234, 183, 176, 185, 190, 171, 172, 165, 162, 143, 136, 129, 134, 147, 148, 157, 154, 39, 32, 41, 46, 59, 60, 53, 50, 31, 24, 17, 22, 3, 4, 13, 10, 87, 80, 89, 94, 75, 76, 69, 66, 111, 104, 97, 102, 115, 116, 125,
              122, 137, 142, 135, 128, 149, 146, 155, 156, 177, 182, 191, 184, 173, 170, 163, 164, 249, 254, 247, 240, 229, 226, 235, 236, 193, 198, 207, 200, 221, 218, 211, 212, 105, 110, 103, 96, 117, 114, 123, 124, 81, 86, 95, 88, 77, 74, 67, 68, 25, 30, 23, 16, 5, 2, 11, 12, 33, 38, 47, 40, 61, 58, 51, 52, 78, 73, 64, 71, 82, 85, 92, 91, 118, 113, 120, 127, 106, 109, 100, 99, 62, 57, 48, 55, 34, 37, 44, 43, 6, 1, 8, 15, 26, 29, 20, 19, 174, 169, 160, 167, 178, 181, 188, 187, 150, 145, 152, 159, 138, 141, 132, 131, 222, 217, 208, 215, 194, 197, 204, 203, 230, 225, 232, 239, 250, 253, 244, 243]
 _crc16_tab = [0, 49345, 49537, 320, 49921, 960, 640, 49729, 50689, 1728, 1920, 51009, 1280, 50625, 50305, 1088, 52225, 3264, 3456, 52545, 3840, 53185, 52865, 3648, 2560, 51905, 52097, 2880, 51457, 2496, 2176, 51265, 55297, 6336, 6528, 55617, 6912, 56257, 55937, 6720, 7680, 57025, 57217, 8000, 56577, 7616, 7296, 56385, 5120, 54465, 54657, 5440, 55041, 6080, 5760, 54849, 53761, 4800, 4992, 54081, 4352, 53697, 53377, 4160, 61441, 12480, 12672, 61761, 13056, 62401, 62081, 12864, 13824, 63169, 63361, 14144, 62721, 13760, 13440, 62529, 15360, 64705, 64897, 15680, 65281, 16320, 16000, 65089, 64001, 15040, 15232, 64321, 14592, 63937, 63617, 14400, 10240, 59585, 59777, 10560, 60161, 11200, 10880, 59969, 60929, 11968, 12160, 61249, 11520, 60865, 60545, 11328, 58369, 9408, 9600, 58689, 9984, 59329, 59009, 9792, 8704, 58049, 58241, 9024, 57601, 8640, 8320, 57409, 40961, 24768,
@@ -31,6 +74,10 @@ def calcCrc16(data: bytes):
     return crc.to_bytes(2, "little")
 
 
+def get_capabilities(product: int):
+    return CAPABILITIES.get(product, _NO_CAPABILITIES)
+
+
 def get_model_name(product: int, model: int):
     if product == 5 and model == 2:
         return "RIVER Max"
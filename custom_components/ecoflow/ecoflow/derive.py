@@ -0,0 +1,127 @@
+from typing import Any, Callable, NamedTuple
+
+_Record = dict[str, Any]
+_OK_ERRORS = (0, 6)
+
+
+class Derived(NamedTuple):
+    stream: str
+    key: str
+    # Fields of other streams that are read, as (stream, field)
+    reads: tuple[tuple[str, str], ...]
+    fn: Callable[[_Record, dict[str, _Record]], Any]
+
+
+def _real_power(prefix: str):
+    (current, voltage, power) = (
+        f"{prefix}_current", f"{prefix}_voltage", f"{prefix}_power")
+
+    def f(d: _Record, latest: dict[str, _Record]):
+        if current in d and voltage in d:
+            return d[current] * d[voltage]
+        return d.get(power)
+    return f
+
+
+def _loss(prefix: str):
+    (real, power) = (f"{prefix}_power_real", f"{prefix}_power")
+
+    def f(d: _Record, latest: dict[str, _Record]):
+        if real in d and power in d:
+            return round(d[real] - d[power], 2)
+        return None
+    return f
+
+
+def _difference(a: str, b: str):
+    def f(d: _Record, latest: dict[str, _Record]):
+        if a in d and b in d:
+            return d[a] - d[b]
+        return None
+    return f
+
+
+def _sum(*keys: str):
+    def f(d: _Record, latest: dict[str, _Record]):
+        return sum(d[x] for x in keys if x in d)
+    return f
+
+
+def _charging(d: _Record, latest: dict[str, _Record]):
+    in_power = d.get("in_power")
+    out_power = d.get("out_power")
+    level = d.get("battery_level")
+    level_max = latest.get("ems", {}).get("battery_level_max")
+    if not in_power:
+        return False
+    if level is not None and level_max is not None and level_max < level:
+        return False
+    if out_power is not None and in_power <= out_power:
+        return False
+    return True
+
+
+_ERRORS = (
+    ("ac", "inverter", "ac_error"),
+    ("battery", "ems", "battery_main_error"),
+    ("dc", "mppt", "dc_in_error"),
+    ("system", "pd", "pd_error"),
+)
+
+
+def _errors(d: _Record, latest: dict[str, _Record]):
+    res = dict[str, int]()
+    for (name, stream, key) in _ERRORS:
+        src = d if stream == "pd" else latest.get(stream, {})
+        if key in src:
+            res[name] = src[key]
+    return res
+
+
+def _error(d: _Record, latest: dict[str, _Record]):
+    return any(x not in _OK_ERRORS for x in d["errors"].values())
+
+
+# Evaluated in order, so later entries can use earlier results
+DERIVED = (
+    Derived("bms", "battery_net_power", (), _difference(
+        "battery_in_power", "battery_out_power")),
+    Derived("inverter", "ac_out_power_real", (), _real_power("ac_out")),
+    Derived("inverter", "ac_loss", (), _loss("ac_out")),
+    Derived("mppt", "dc_in_power_real", (), _real_power("dc_in")),
+    Derived("mppt", "car_out_power_real", (), _real_power("car_out")),
+    Derived("mppt", "car_loss", (), _loss("car_out")),
+    Derived("pd", "in_energy", (), _sum(
+        "ac_in_energy", "car_in_energy", "mppt_in_energy")),
+    Derived("pd", "out_energy", (), _sum("ac_out_energy", "car_out_energy")),
+    Derived("pd", "net_power", (), _difference("in_power", "out_power")),
+    Derived("pd", "charging", (("ems", "battery_level_max"),), _charging),
+    Derived("pd", "errors", tuple((x[1], x[2])
+            for x in _ERRORS if x[1] != "pd"), _errors),
+    Derived("pd", "error", (), _error),
+)
+
+
+class Deriver:
+    def __init__(self):
+        self.latest = dict[str, _Record]()
+        self.__derived = dict[str, list[Derived]]()
+        # stream -> [(field, stream reading it)]
+        self.__reads = dict[str, list[tuple[str, str]]]()
+        for x in DERIVED:
+            self.__derived.setdefault(x.stream, []).append(x)
+            for (stream, key) in x.reads:
+                self.__reads.setdefault(stream, []).append((key, x.stream))
+
+    def update(self, name: str, data: _Record):
+        for x in self.__derived.get(name, ()):
+            if (value := x.fn(data, self.latest)) is not None:
+                data[x.key] = value
+        prev = self.latest.get(name)
+        self.latest[name] = data
+        # Streams whose derived fields are stale after this record
+        stale = set[str]()
+        for (key, stream) in self.__reads.get(name, ()):
+            if prev is None or prev.get(key) != data.get(key):
+                stale.add(stream)
+        return stale
@@ -0,0 +1,79 @@
+import asyncio
+from ipaddress import ip_address, ip_network
+from typing import Iterable, Optional
+
+from . import PORT, receive, send
+
+PROBE_CONNECT_TIMEOUT = 1
+PROBE_PARALLEL = 32
+PROBE_TIMEOUT = 3
+
+
+async def probe(host: str, sem: asyncio.Semaphore) -> Optional[receive.Serial]:
+    async with sem:
+        try:
+            (rx, tx) = await asyncio.wait_for(asyncio.open_connection(host, PORT), PROBE_CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        result = asyncio.get_running_loop().create_future()
+
+        def packet(x: bytes):
+            x = receive.decode_packet(x)
+            if receive.is_serial_main(x) and not result.done():
+                result.set_result(receive.parse_serial(x[3]))
+        merge = receive.merge_packet(packet)
+
+        async def read():
+            while not result.done() and not rx.at_eof():
+                merge(await rx.read(1024))
+
+        try:
+            tx.write(send.get_serial_main())
+            await asyncio.wait_for(read(), PROBE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            tx.close()
+        return result.result() if result.done() else None
+
+
+async def find_station(hosts: Iterable[str], serial: str) -> Optional[str]:
+    sem = asyncio.Semaphore(PROBE_PARALLEL)
+
+    async def check(host: str):
+        info = await probe(host, sem)
+        return host if info and info["serial"] == serial else None
+    tasks = [asyncio.create_task(check(x)) for x in hosts]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            if host := await fut:
+                return host
+    finally:
+        for task in tasks:
+            task.cancel()
+    return None
+
+
+def read_neighbours(path: str = "/proc/net/arp"):
+    res = dict[str, str]()
+    try:
+        with open(path) as f:
+            next(f, None)
+            for line in f:
+                cols = line.split()
+                if len(cols) >= 4 and cols[3] != "00:00:00:00:00:00":
+                    res[cols[3].lower()] = cols[0]
+    except OSError:
+        pass
+    return res
+
+
+def subnet_hosts(host: str, prefix: int = 24):
+    try:
+        addr = ip_address(host)
+    except ValueError:
+        return []
+    if addr.version != 4:
+        return []
+    net = ip_network(f"{addr}/{prefix}", strict=False)
+    return [str(x) for x in net.hosts() if x != addr]
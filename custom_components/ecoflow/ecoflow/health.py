@@ -0,0 +1,101 @@
+from typing import Any, Optional
+
+FADE_ALPHA = 0.2
+MIN_CURRENT_STEP = 0.5
+MIN_UPDATES = 10
+RLS_FORGET = 0.995
+SOH_ALPHA = 0.05
+
+
+def _to_signed(v: int):
+    return v - (1 << 32) if v >= 1 << 31 else v
+
+
+class Ewma:
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.value: Optional[float] = None
+
+    def update(self, x: float):
+        if self.value is None:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+
+class ResistanceEstimator:
+    # Scalar recursive least squares on dV = -R * dI, which cancels the open
+    # circuit voltage between consecutive frames
+    def __init__(self, forget: float = RLS_FORGET):
+        self.forget = forget
+        self.updates = 0
+        self.__r = 0.0
+        self.__p = 1.0
+        self.__last: Optional[tuple[float, float]] = None
+
+    @property
+    def value(self):
+        if self.updates < MIN_UPDATES or self.__r <= 0:
+            return None
+        return self.__r
+
+    def update(self, voltage: float, current: float):
+        last = self.__last
+        self.__last = (voltage, current)
+        if last is None:
+            return self.value
+        x = last[1] - current
+        if abs(x) < MIN_CURRENT_STEP:
+            return self.value
+        y = voltage - last[0]
+        k = self.__p * x / (self.forget + x * self.__p * x)
+        self.__r += k * (y - x * self.__r)
+        self.__p = (self.__p - k * x * self.__p) / self.forget
+        self.updates += 1
+        return self.value
+
+
+class CapacityFadeEstimator:
+    def __init__(self, alpha: float = FADE_ALPHA):
+        self.slope = Ewma(alpha)
+        self.__anchor: Optional[tuple[int, int]] = None
+
+    @property
+    def value(self):
+        return self.slope.value
+
+    def update(self, cycles: int, full: int):
+        anchor = self.__anchor
+        if anchor is None or cycles < anchor[0]:
+            self.__anchor = (cycles, full)
+        elif cycles > anchor[0]:
+            self.slope.update((full - anchor[1]) / (cycles - anchor[0]))
+            self.__anchor = (cycles, full)
+        return self.value
+
+
+class PackHealth:
+    def __init__(self):
+        self.resistance = ResistanceEstimator()
+        self.soh = Ewma(SOH_ALPHA)
+        self.fade = CapacityFadeEstimator()
+
+    def update(self, data: dict[str, Any]):
+        voltage = data.get("battery_voltage")
+        current = data.get("battery_current")
+        if voltage is not None and current is not None:
+            self.resistance.update(voltage, _to_signed(current) / 1000)
+        full = data.get("battery_capacity_full")
+        design = data.get("battery_capacity_design")
+        if full and design:
+            self.soh.update(full * 100 / design)
+        cycles = data.get("battery_cycles")
+        if full and cycles is not None:
+            self.fade.update(cycles, full)
+        r = self.resistance.value
+        return {
+            "internal_resistance": None if r is None else round(r * 1000, 1),
+            "state_of_health": None if self.soh.value is None else round(self.soh.value, 1),
+            "capacity_fade": None if self.fade.value is None else round(-self.fade.value * 100),
+        }
@@ -0,0 +1,73 @@
+import asyncio
+from logging import getLogger
+from typing import Optional
+
+from . import receive
+from .rxtcp import RxTcpAutoConnection
+
+LOCALHOST = "127.0.0.1"
+WRITE_BUFFER_LIMIT = 1 << 16
+
+_LOGGER = getLogger(__name__)
+
+
+class MuxProxy:
+    def __init__(self, tcp: RxTcpAutoConnection, port: int, host: str = LOCALHOST):
+        self.tcp = tcp
+        self.host = host
+        self.port = port
+        self.__server: Optional[asyncio.AbstractServer] = None
+        self.__writers = set[asyncio.StreamWriter]()
+        self.__sub = tcp.received.subscribe(self.__on_raw)
+
+    @property
+    def clients(self):
+        return len(self.__writers)
+
+    async def start(self):
+        try:
+            self.__server = await asyncio.start_server(
+                self.__on_client, self.host, self.port)
+        except OSError as ex:
+            _LOGGER.error(f"proxy for {self.tcp.host} could not listen on {self.port}: {ex}")
+
+    async def close(self):
+        self.__sub.dispose()
+        if self.__server:
+            self.__server.close()
+            await self.__server.wait_closed()
+        for writer in list(self.__writers):
+            writer.close()
+        self.__writers.clear()
+
+    def __on_raw(self, data: Optional[bytes]):
+        if data is None:
+            return
+        for writer in list(self.__writers):
+            if writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+                _LOGGER.debug("dropping slow proxy client")
+                self.__writers.discard(writer)
+                writer.close()
+                continue
+            # Every client gets the same buffer
+            writer.write(data)
+
+    def __write_upstream(self, frame: bytes):
+        try:
+            self.tcp.write(frame)
+        except Exception as ex:
+            _LOGGER.debug(ex)
+
+    async def __on_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.__writers.add(writer)
+        # Only whole frames go upstream, so commands of different clients
+        # never interleave
+        merge = receive.merge_packet(self.__write_upstream)
+        try:
+            while data := await reader.read(4096):
+                merge(data)
+        except Exception as ex:
+            _LOGGER.debug(ex)
+        finally:
+            self.__writers.discard(writer)
+            writer.close()
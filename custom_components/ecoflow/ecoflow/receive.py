@@ -2,11 +2,22 @@ import struct
 from datetime import timedelta
 from typing import Any, Callable, Iterable, Optional, TypedDict, cast
 
-from reactivex import Observable, Observer
-
 from . import calcCrc8, calcCrc16, is_delta, is_river
 
 
+MESSAGES: dict[str, tuple[tuple[int, int, int], ...]] = {
+    "bms": ((3, 32, 50), (6, 32, 2), (6, 32, 50)),
+    "dc_in_current_config": ((4, 32, 72), (5, 32, 72)),
+    "dc_in_type": ((4, 32, 68), (5, 32, 82)),
+    "ems": ((3, 32, 2),),
+    "fan_auto": ((4, 32, 74),),
+    "inverter": ((4, 32, 2),),
+    "lcd_timeout": ((2, 32, 40),),
+    "mppt": ((5, 32, 2),),
+    "pd": ((2, 32, 2),),
+}
+
+
 class Serial(TypedDict):
     chk_val: int
     product: int
@@ -16,35 +27,32 @@ class Serial(TypedDict):
     cpu_id: str
 
 
-def _merge_packet(obs: Observable[Optional[bytes]]):
-    def func(sub: Observer[bytes], sched=None):
-        x = b''
-
-        def next(rcv: Optional[bytes]):
-            nonlocal x
-            if rcv is None:
-                x = b''
+def _merge_packet(emit: Callable[[bytes], Any]):
+    x = b''
+
+    def next(rcv: Optional[bytes]):
+        nonlocal x
+        if rcv is None:
+            x = b''
+            return
+        x += rcv
+        while len(x) >= 18:
+            if x[:2] != b'\xaa\x02':
+                x = x[1:]
+                continue
+            size = int.from_bytes(x[2:4], 'little')
+            if 18 + size > len(x):
                 return
-            x += rcv
-            while len(x) >= 18:
-                if x[:2] != b'\xaa\x02':
-                    x = x[1:]
-                    continue
-                size = int.from_bytes(x[2:4], 'little')
-                if 18 + size > len(x):
-                    return
-                if calcCrc8(x[:4]) != x[4:5]:
-                    x = x[2:]
-                    continue
-                if calcCrc16(x[:16 + size]) != x[16 + size:18 + size]:
-                    x = x[2:]
-                    continue
-                sub.on_next(x[:18 + size])
-                x = x[18 + size:]
-
-        return obs.subscribe(next, sub.on_error, sub.on_completed, scheduler=sched)
-
-    return Observable[bytes](func)
+            if calcCrc8(x[:4]) != x[4:5]:
+                x = x[2:]
+                continue
+            if calcCrc16(x[:16 + size]) != x[16 + size:18 + size]:
+                x = x[2:]
+                continue
+            emit(x[:18 + size])
+            x = x[18 + size:]
+
+    return next
 
 
 def _parse_dict(d: bytes, types: Iterable[tuple[str, int, Callable[[bytes], Any]]]):
@@ -110,40 +118,50 @@ def decode_packet(x: bytes):
     return (x[12], x[14], x[15], args)
 
 
+def get_fields(name: str, product: int):
+    if is_delta(product):
+        table = _DELTA_TABLES.get(name, [])
+    elif is_river(product):
+        table = _RIVER_TABLES.get(name, [])
+    else:
+        table = []
+    return [x for x in table if x[0] not in (None, "num")]
+
+
 def is_bms(x: tuple[int, int, int]):
-    return x[0:3] == (3, 32, 50) or x[0:3] == (6, 32, 2) or x[0:3] == (6, 32, 50)
+    return x[0:3] in MESSAGES["bms"]
 
 
 def is_dc_in_current_config(x: tuple[int, int, int]):
-    return x[0:3] == (4, 32, 72) or x[0:3] == (5, 32, 72)
+    return x[0:3] in MESSAGES["dc_in_current_config"]
 
 
 def is_dc_in_type(x: tuple[int, int, int]):
-    return x[0:3] == (4, 32, 68) or x[0:3] == (5, 32, 82)
+    return x[0:3] in MESSAGES["dc_in_type"]
 
 
 def is_ems(x: tuple[int, int, int]):
-    return x[0:3] == (3, 32, 2)
+    return x[0:3] in MESSAGES["ems"]
 
 
 def is_fan_auto(x: tuple[int, int, int]):
-    return x[0:3] == (4, 32, 74)
+    return x[0:3] in MESSAGES["fan_auto"]
 
 
 def is_inverter(x: tuple[int, int, int]):
-    return x[0:3] == (4, 32, 2)
+    return x[0:3] in MESSAGES["inverter"]
 
 
 def is_lcd_timeout(x: tuple[int, int, int]):
-    return x[0:3] == (2, 32, 40)
+    return x[0:3] in MESSAGES["lcd_timeout"]
 
 
 def is_mppt(x: tuple[int, int, int]):
-    return x[0:3] == (5, 32, 2)
+    return x[0:3] in MESSAGES["mppt"]
 
 
 def is_pd(x: tuple[int, int, int]):
-    return x[0:3] == (2, 32, 2)
+    return x[0:3] in MESSAGES["pd"]
 
 
 def is_serial_main(x: tuple[int, int, int]):
@@ -162,56 +180,62 @@ def parse_bms(d: bytes, product: int):
     return (0, {})
 
 
+_BMS_DELTA = [
+    ("num", 1, _to_int),
+    ("battery_type", 1, _to_int),
+    ("battery_cell_id", 1, _to_int),
+    ("battery_error", 4, _to_int),
+    ("battery_version", 4, _to_ver_reversed),
+    ("battery_level", 1, _to_int),
+    ("battery_voltage", 4, _to_int_ex(div=1000)),
+    ("battery_current", 4, _to_int),
+    ("battery_temp", 1, _to_int),
+    ("_open_bms_idx", 1, _to_int),
+    ("battery_capacity_design", 4, _to_int),
+    ("battery_capacity_remain", 4, _to_int),
+    ("battery_capacity_full", 4, _to_int),
+    ("battery_cycles", 4, _to_int),
+    ("_soh", 1, _to_int),
+    ("battery_voltage_max", 2, _to_int_ex(div=1000)),
+    ("battery_voltage_min", 2, _to_int_ex(div=1000)),
+    ("battery_temp_max", 1, _to_int),
+    ("battery_temp_min", 1, _to_int),
+    ("battery_mos_temp_max", 1, _to_int),
+    ("battery_mos_temp_min", 1, _to_int),
+    ("battery_fault", 1, _to_int),
+    ("_sys_stat_reg", 1, _to_int),
+    ("_tag_chg_current", 4, _to_int),
+    ("battery_level_f32", 4, _to_float),
+    ("battery_in_power", 4, _to_int),
+    ("battery_out_power", 4, _to_int),
+    ("battery_remain", 4, _to_timedelta_min),
+]
+
+
 def parse_bms_delta(d: bytes):
-    val = _parse_dict(d, [
-        ("num", 1, _to_int),
-        ("battery_type", 1, _to_int),
-        ("battery_cell_id", 1, _to_int),
-        ("battery_error", 4, _to_int),
-        ("battery_version", 4, _to_ver_reversed),
-        ("battery_level", 1, _to_int),
-        ("battery_voltage", 4, _to_int_ex(div=1000)),
-        ("battery_current", 4, _to_int),
-        ("battery_temp", 1, _to_int),
-        ("_open_bms_idx", 1, _to_int),
-        ("battery_capacity_design", 4, _to_int),
-        ("battery_capacity_remain", 4, _to_int),
-        ("battery_capacity_full", 4, _to_int),
-        ("battery_cycles", 4, _to_int),
-        ("_soh", 1, _to_int),
-        ("battery_voltage_max", 2, _to_int_ex(div=1000)),
-        ("battery_voltage_min", 2, _to_int_ex(div=1000)),
-        ("battery_temp_max", 1, _to_int),
-        ("battery_temp_min", 1, _to_int),
-        ("battery_mos_temp_max", 1, _to_int),
-        ("battery_mos_temp_min", 1, _to_int),
-        ("battery_fault", 1, _to_int),
-        ("_sys_stat_reg", 1, _to_int),
-        ("_tag_chg_current", 4, _to_int),
-        ("battery_level_f32", 4, _to_float),
-        ("battery_in_power", 4, _to_int),
-        ("battery_out_power", 4, _to_int),
-        ("battery_remain", 4, _to_timedelta_min),
-    ])
+    val = _parse_dict(d, _BMS_DELTA)
     return (cast(int, val.pop("num")), val)
 
 
+_BMS_RIVER = [
+    ("battery_error", 4, _to_int),
+    ("battery_version", 4, _to_ver_reversed),
+    ("battery_level", 1, _to_int),
+    ("battery_voltage", 4, _to_int_ex(div=1000)),
+    ("battery_current", 4, _to_int),
+    ("battery_temp", 1, _to_int),
+    ("battery_capacity_remain", 4, _to_int),
+    ("battery_capacity_full", 4, _to_int),
+    ("battery_cycles", 4, _to_int),
+    ("ambient_mode", 1, _to_int),
+    ("ambient_animate", 1, _to_int),
+    ("ambient_color", 4, list),
+    ("ambient_brightness", 1, _to_int),
+]
+
+
 def parse_bms_river(d: bytes):
-    return (1, _parse_dict(d, [
-        ("battery_error", 4, _to_int),
-        ("battery_version", 4, _to_ver_reversed),
-        ("battery_level", 1, _to_int),
-        ("battery_voltage", 4, _to_int_ex(div=1000)),
-        ("battery_current", 4, _to_int),
-        ("battery_temp", 1, _to_int),
-        ("battery_capacity_remain", 4, _to_int),
-        ("battery_capacity_full", 4, _to_int),
-        ("battery_cycles", 4, _to_int),
-        ("ambient_mode", 1, _to_int),
-        ("ambient_animate", 1, _to_int),
-        ("ambient_color", 4, list),
-        ("ambient_brightness", 1, _to_int),
-    ]))
+    return (1, _parse_dict(d, _BMS_RIVER))
 
 
 def parse_dc_in_current_config(d: bytes):
@@ -232,57 +256,63 @@ def parse_ems(d: bytes, product: int):
     return {}
 
 
+_EMS_DELTA = [
+    ("_state_charge", 1, _to_int),
+    ("_chg_cmd", 1, _to_int),
+    ("_dsg_cmd", 1, _to_int),
+    ("battery_main_voltage", 4, _to_int_ex(div=1000)),
+    ("battery_main_current", 4, _to_int_ex(div=1000)),
+    ("_fan_level", 1, _to_int),
+    ("battery_level_max", 1, _to_int),
+    ("model", 1, _to_int),
+    ("battery_main_level", 1, _to_int),
+    ("_flag_open_ups", 1, _to_int),
+    ("battery_main_warning", 1, _to_int),
+    ("battery_remain_charge", 4, _to_timedelta_min),
+    ("battery_remain_discharge", 4, _to_timedelta_min),
+    ("battery_main_normal", 1, _to_int),
+    ("battery_main_level_f32", 4, _to_float),
+    ("_is_connect", 3, _to_int),
+    ("_max_available_num", 1, _to_int),
+    ("_open_bms_idx", 1, _to_int),
+    ("battery_main_voltage_min", 4, _to_int_ex(div=1000)),
+    ("battery_main_voltage_max", 4, _to_int_ex(div=1000)),
+    ("battery_level_min", 1, _to_int),
+    ("generator_level_start", 1, _to_int),
+    ("generator_level_stop", 1, _to_int),
+]
+
+
 def parse_ems_delta(d: bytes):
-    return _parse_dict(d, [
-        ("_state_charge", 1, _to_int),
-        ("_chg_cmd", 1, _to_int),
-        ("_dsg_cmd", 1, _to_int),
-        ("battery_main_voltage", 4, _to_int_ex(div=1000)),
-        ("battery_main_current", 4, _to_int_ex(div=1000)),
-        ("_fan_level", 1, _to_int),
-        ("battery_level_max", 1, _to_int),
-        ("model", 1, _to_int),
-        ("battery_main_level", 1, _to_int),
-        ("_flag_open_ups", 1, _to_int),
-        ("battery_main_warning", 1, _to_int),
-        ("battery_remain_charge", 4, _to_timedelta_min),
-        ("battery_remain_discharge", 4, _to_timedelta_min),
-        ("battery_main_normal", 1, _to_int),
-        ("battery_main_level_f32", 4, _to_float),
-        ("_is_connect", 3, _to_int),
-        ("_max_available_num", 1, _to_int),
-        ("_open_bms_idx", 1, _to_int),
-        ("battery_main_voltage_min", 4, _to_int_ex(div=1000)),
-        ("battery_main_voltage_max", 4, _to_int_ex(div=1000)),
-        ("battery_level_min", 1, _to_int),
-        ("generator_level_start", 1, _to_int),
-        ("generator_level_stop", 1, _to_int),
-    ])
+    return _parse_dict(d, _EMS_DELTA)
+
+
+_EMS_RIVER = [
+    ("battery_main_error", 4, _to_int),
+    ("battery_main_version", 4, _to_ver_reversed),
+    ("battery_main_level", 1, _to_int),
+    ("battery_main_voltage", 4, _to_int_ex(div=1000)),
+    ("battery_main_current", 4, _to_int),
+    ("battery_main_temp", 1, _to_int),
+    ("_open_bms_idx", 1, _to_int),
+    ("battery_capacity_remain", 4, _to_int),
+    ("battery_capacity_full", 4, _to_int),
+    ("battery_cycles", 4, _to_int),
+    ("battery_level_max", 1, _to_int),
+    ("battery_main_voltage_max", 2, _to_int_ex(div=1000)),
+    ("battery_main_voltage_min", 2, _to_int_ex(div=1000)),
+    ("battery_main_temp_max", 1, _to_int),
+    ("battery_main_temp_min", 1, _to_int),
+    ("mos_temp_max", 1, _to_int),
+    ("mos_temp_min", 1, _to_int),
+    ("battery_main_fault", 1, _to_int),
+    ("_bq_sys_stat_reg", 1, _to_int),
+    ("_tag_chg_amp", 4, _to_int),
+]
 
 
 def parse_ems_river(d: bytes):
-    return _parse_dict(d, [
-        ("battery_main_error", 4, _to_int),
-        ("battery_main_version", 4, _to_ver_reversed),
-        ("battery_main_level", 1, _to_int),
-        ("battery_main_voltage", 4, _to_int_ex(div=1000)),
-        ("battery_main_current", 4, _to_int),
-        ("battery_main_temp", 1, _to_int),
-        ("_open_bms_idx", 1, _to_int),
-        ("battery_capacity_remain", 4, _to_int),
-        ("battery_capacity_full", 4, _to_int),
-        ("battery_cycles", 4, _to_int),
-        ("battery_level_max", 1, _to_int),
-        ("battery_main_voltage_max", 2, _to_int_ex(div=1000)),
-        ("battery_main_voltage_min", 2, _to_int_ex(div=1000)),
-        ("battery_main_temp_max", 1, _to_int),
-        ("battery_main_temp_min", 1, _to_int),
-        ("mos_temp_max", 1, _to_int),
-        ("mos_temp_min", 1, _to_int),
-        ("battery_main_fault", 1, _to_int),
-        ("_bq_sys_stat_reg", 1, _to_int),
-        ("_tag_chg_amp", 4, _to_int),
-    ])
+    return _parse_dict(d, _EMS_RIVER)
 
 
 # def parse_ems_river_mini(d: bytes):
@@ -302,65 +332,71 @@ def parse_inverter(d: bytes, product: int):
     return {}
 
 
+_INVERTER_DELTA = [
+    ("ac_error", 4, _to_int),
+    ("ac_version", 4, _to_ver_reversed),
+    ("ac_in_type", 1, _to_int),
+    ("ac_in_power", 2, _to_int),
+    ("ac_out_power", 2, _to_int),
+    ("ac_type", 1, _to_int),
+    ("ac_out_voltage", 4, _to_int_ex(div=1000)),
+    ("ac_out_current", 4, _to_int_ex(div=1000)),
+    ("ac_out_freq", 1, _to_int),
+    ("ac_in_voltage", 4, _to_int_ex(div=1000)),
+    ("ac_in_current", 4, _to_int_ex(div=1000)),
+    ("ac_in_freq", 1, _to_int),
+    ("ac_out_temp", 2, _to_int),
+    ("dc_in_voltage", 4, _to_int),
+    ("dc_in_current", 4, _to_int),
+    ("ac_in_temp", 2, _to_int),
+    ("fan_state", 1, _to_int),
+    ("ac_out_state", 1, _to_int),
+    ("ac_out_xboost", 1, _to_int),
+    ("ac_out_voltage_config", 4, _to_int_ex(div=1000)),
+    ("ac_out_freq_config", 1, _to_int),
+    ("fan_config", 1, _to_int),
+    ("ac_in_pause", 1, _to_int),
+    ("ac_in_limit_switch", 1, _to_int),
+    ("ac_in_limit_max", 2, _to_int),
+    ("ac_in_limit_custom", 2, _to_int),
+    ("ac_out_timeout", 2, _to_int),
+]
+
+
 def parse_inverter_delta(d: bytes):
-    return _parse_dict(d, [
-        ("ac_error", 4, _to_int),
-        ("ac_version", 4, _to_ver_reversed),
-        ("ac_in_type", 1, _to_int),
-        ("ac_in_power", 2, _to_int),
-        ("ac_out_power", 2, _to_int),
-        ("ac_type", 1, _to_int),
-        ("ac_out_voltage", 4, _to_int_ex(div=1000)),
-        ("ac_out_current", 4, _to_int_ex(div=1000)),
-        ("ac_out_freq", 1, _to_int),
-        ("ac_in_voltage", 4, _to_int_ex(div=1000)),
-        ("ac_in_current", 4, _to_int_ex(div=1000)),
-        ("ac_in_freq", 1, _to_int),
-        ("ac_out_temp", 2, _to_int),
-        ("dc_in_voltage", 4, _to_int),
-        ("dc_in_current", 4, _to_int),
-        ("ac_in_temp", 2, _to_int),
-        ("fan_state", 1, _to_int),
-        ("ac_out_state", 1, _to_int),
-        ("ac_out_xboost", 1, _to_int),
-        ("ac_out_voltage_config", 4, _to_int_ex(div=1000)),
-        ("ac_out_freq_config", 1, _to_int),
-        ("fan_config", 1, _to_int),
-        ("ac_in_pause", 1, _to_int),
-        ("ac_in_limit_switch", 1, _to_int),
-        ("ac_in_limit_max", 2, _to_int),
-        ("ac_in_limit_custom", 2, _to_int),
-        ("ac_out_timeout", 2, _to_int),
-    ])
+    return _parse_dict(d, _INVERTER_DELTA)
+
+
+_INVERTER_RIVER = [
+    ("ac_error", 4, _to_int),
+    ("ac_version", 4, _to_ver_reversed),
+    ("in_type", 1, _to_int),
+    ("in_power", 2, _to_int),
+    ("ac_out_power", 2, _to_int),
+    ("ac_type", 1, _to_int),
+    ("ac_out_voltage", 4, _to_int_ex(div=1000)),
+    ("ac_out_current", 4, _to_int_ex(div=1000)),
+    ("ac_out_freq", 1, _to_int),
+    ("ac_in_voltage", 4, _to_int_ex(div=1000)),
+    ("ac_in_current", 4, _to_int_ex(div=1000)),
+    ("ac_in_freq", 1, _to_int),
+    ("ac_out_temp", 1, _to_int),
+    ("dc_in_voltage", 4, _to_int_ex(div=1000)),
+    ("dc_in_current", 4, _to_int_ex(div=1000)),
+    ("ac_in_temp", 1, _to_int),
+    ("fan_state", 1, _to_int),
+    ("ac_out_state", 1, _to_int),
+    ("ac_out_xboost", 1, _to_int),
+    ("ac_out_voltage_config", 4, _to_int_ex(div=1000)),
+    ("ac_out_freq_config", 1, _to_int),
+    ("ac_in_slow", 1, _to_int),
+    ("ac_out_timeout", 2, _to_int),
+    ("fan_config", 1, _to_int),
+]
 
 
 def parse_inverter_river(d: bytes):
-    return _parse_dict(d, [
-        ("ac_error", 4, _to_int),
-        ("ac_version", 4, _to_ver_reversed),
-        ("in_type", 1, _to_int),
-        ("in_power", 2, _to_int),
-        ("ac_out_power", 2, _to_int),
-        ("ac_type", 1, _to_int),
-        ("ac_out_voltage", 4, _to_int_ex(div=1000)),
-        ("ac_out_current", 4, _to_int_ex(div=1000)),
-        ("ac_out_freq", 1, _to_int),
-        ("ac_in_voltage", 4, _to_int_ex(div=1000)),
-        ("ac_in_current", 4, _to_int_ex(div=1000)),
-        ("ac_in_freq", 1, _to_int),
-        ("ac_out_temp", 1, _to_int),
-        ("dc_in_voltage", 4, _to_int_ex(div=1000)),
-        ("dc_in_current", 4, _to_int_ex(div=1000)),
-        ("ac_in_temp", 1, _to_int),
-        ("fan_state", 1, _to_int),
-        ("ac_out_state", 1, _to_int),
-        ("ac_out_xboost", 1, _to_int),
-        ("ac_out_voltage_config", 4, _to_int_ex(div=1000)),
-        ("ac_out_freq_config", 1, _to_int),
-        ("ac_in_slow", 1, _to_int),
-        ("ac_out_timeout", 2, _to_int),
-        ("fan_config", 1, _to_int),
-    ])
+    return _parse_dict(d, _INVERTER_RIVER)
 
 
 def parse_lcd_timeout(d: bytes):
@@ -373,36 +409,39 @@ def parse_mppt(d: bytes, product: int):
     return {}
 
 
+_MPPT_DELTA = [
+    ("dc_in_error", 4, _to_int),
+    ("dc_in_version", 4, _to_ver_reversed),
+    ("dc_in_voltage", 4, _to_int_ex(div=10)),
+    ("dc_in_current", 4, _to_int_ex(div=100)),
+    ("dc_in_power", 2, _to_int_ex(div=10)),
+    ("_volt_?_out", 4, _to_int),
+    ("_curr_?_out", 4, _to_int),
+    ("_watts_?_out", 2, _to_int),
+    ("dc_in_temp", 2, _to_int),
+    ("dc_in_type", 1, _to_int),
+    ("dc_in_type_config", 1, _to_int),
+    ("_dc_in_type", 1, _to_int),
+    ("dc_in_state", 1, _to_int),
+    ("anderson_out_voltage", 4, _to_int),
+    ("anderson_out_current", 4, _to_int),
+    ("anderson_out_power", 2, _to_int),
+    ("car_out_voltage", 4, _to_int_ex(div=10)),
+    ("car_out_current", 4, _to_int_ex(div=100)),
+    ("car_out_power", 2, _to_int_ex(div=10)),
+    ("car_out_temp", 2, _to_int),
+    ("car_out_state", 1, _to_int),
+    ("dc24_temp", 2, _to_int),
+    ("dc24_state", 1, _to_int),
+    ("dc_in_pause", 1, _to_int),
+    ("_dc_in_switch", 1, _to_int),
+    ("_dc_in_limit_max", 2, _to_int),
+    ("_dc_in_limit_custom", 2, _to_int),
+]
+
+
 def parse_mppt_delta(d: bytes):
-    return _parse_dict(d, [
-        ("dc_in_error", 4, _to_int),
-        ("dc_in_version", 4, _to_ver_reversed),
-        ("dc_in_voltage", 4, _to_int_ex(div=10)),
-        ("dc_in_current", 4, _to_int_ex(div=100)),
-        ("dc_in_power", 2, _to_int_ex(div=10)),
-        ("_volt_?_out", 4, _to_int),
-        ("_curr_?_out", 4, _to_int),
-        ("_watts_?_out", 2, _to_int),
-        ("dc_in_temp", 2, _to_int),
-        ("dc_in_type", 1, _to_int),
-        ("dc_in_type_config", 1, _to_int),
-        ("_dc_in_type", 1, _to_int),
-        ("dc_in_state", 1, _to_int),
-        ("anderson_out_voltage", 4, _to_int),
-        ("anderson_out_current", 4, _to_int),
-        ("anderson_out_power", 2, _to_int),
-        ("car_out_voltage", 4, _to_int_ex(div=10)),
-        ("car_out_current", 4, _to_int_ex(div=100)),
-        ("car_out_power", 2, _to_int_ex(div=10)),
-        ("car_out_temp", 2, _to_int),
-        ("car_out_state", 1, _to_int),
-        ("dc24_temp", 2, _to_int),
-        ("dc24_state", 1, _to_int),
-        ("dc_in_pause", 1, _to_int),
-        ("_dc_in_switch", 1, _to_int),
-        ("_dc_in_limit_max", 2, _to_int),
-        ("_dc_in_limit_custom", 2, _to_int),
-    ])
+    return _parse_dict(d, _MPPT_DELTA)
 
 
 def parse_pd(d: bytes, product: int):
@@ -415,85 +454,91 @@ def parse_pd(d: bytes, product: int):
     return {}
 
 
+_PD_DELTA = [
+    ("model", 1, _to_int),
+    ("pd_error", 4, _to_int),
+    ("pd_version", 4, _to_ver_reversed),
+    ("wifi_version", 4, _to_ver_reversed),
+    ("wifi_autorecovery", 1, _to_int),
+    ("battery_level", 1, _to_int),
+    ("out_power", 2, _to_int),
+    ("in_power", 2, _to_int),
+    ("remain_display", 4, _to_timedelta_min),
+    ("beep", 1, _to_int),
+    ("_watts_anderson_out", 1, _to_int),
+    ("usb_out1_power", 1, _to_int),
+    ("usb_out2_power", 1, _to_int),
+    ("usbqc_out1_power", 1, _to_int),
+    ("usbqc_out2_power", 1, _to_int),
+    ("typec_out1_power", 1, _to_int),
+    ("typec_out2_power", 1, _to_int),
+    ("typec_out1_temp", 1, _to_int),
+    ("typec_out2_temp", 1, _to_int),
+    ("car_out_state", 1, _to_int),
+    ("car_out_power", 1, _to_int),
+    ("car_out_temp", 1, _to_int),
+    ("standby_timeout", 2, _to_int),
+    ("lcd_timeout", 2, _to_int),
+    ("lcd_brightness", 1, _to_int),
+    ("car_in_energy", 4, _to_int),
+    ("mppt_in_energy", 4, _to_int),
+    ("ac_in_energy", 4, _to_int),
+    ("car_out_energy", 4, _to_int),
+    ("ac_out_energy", 4, _to_int),
+    ("usb_time", 4, _to_timedelta_sec),
+    ("typec_time", 4, _to_timedelta_sec),
+    ("car_out_time", 4, _to_timedelta_sec),
+    ("ac_out_time", 4, _to_timedelta_sec),
+    ("ac_in_time", 4, _to_timedelta_sec),
+    ("car_in_time", 4, _to_timedelta_sec),
+    ("mppt_time", 4, _to_timedelta_sec),
+    (None, 2, None),
+    ("_ext_rj45", 1, _to_int),
+    ("_ext_infinity", 1, _to_int),
+]
+
+
 def parse_pd_delta(d: bytes):
-    return _parse_dict(d, [
-        ("model", 1, _to_int),
-        ("pd_error", 4, _to_int),
-        ("pd_version", 4, _to_ver_reversed),
-        ("wifi_version", 4, _to_ver_reversed),
-        ("wifi_autorecovery", 1, _to_int),
-        ("battery_level", 1, _to_int),
-        ("out_power", 2, _to_int),
-        ("in_power", 2, _to_int),
-        ("remain_display", 4, _to_timedelta_min),
-        ("beep", 1, _to_int),
-        ("_watts_anderson_out", 1, _to_int),
-        ("usb_out1_power", 1, _to_int),
-        ("usb_out2_power", 1, _to_int),
-        ("usbqc_out1_power", 1, _to_int),
-        ("usbqc_out2_power", 1, _to_int),
-        ("typec_out1_power", 1, _to_int),
-        ("typec_out2_power", 1, _to_int),
-        ("typec_out1_temp", 1, _to_int),
-        ("typec_out2_temp", 1, _to_int),
-        ("car_out_state", 1, _to_int),
-        ("car_out_power", 1, _to_int),
-        ("car_out_temp", 1, _to_int),
-        ("standby_timeout", 2, _to_int),
-        ("lcd_timeout", 2, _to_int),
-        ("lcd_brightness", 1, _to_int),
-        ("car_in_energy", 4, _to_int),
-        ("mppt_in_energy", 4, _to_int),
-        ("ac_in_energy", 4, _to_int),
-        ("car_out_energy", 4, _to_int),
-        ("ac_out_energy", 4, _to_int),
-        ("usb_time", 4, _to_timedelta_sec),
-        ("typec_time", 4, _to_timedelta_sec),
-        ("car_out_time", 4, _to_timedelta_sec),
-        ("ac_out_time", 4, _to_timedelta_sec),
-        ("ac_in_time", 4, _to_timedelta_sec),
-        ("car_in_time", 4, _to_timedelta_sec),
-        ("mppt_time", 4, _to_timedelta_sec),
-        (None, 2, None),
-        ("_ext_rj45", 1, _to_int),
-        ("_ext_infinity", 1, _to_int),
-    ])
+    return _parse_dict(d, _PD_DELTA)
+
+
+_PD_RIVER = [
+    ("model", 1, _to_int),
+    ("pd_error", 4, _to_int),
+    ("pd_version", 4, _to_ver_reversed),
+    ("battery_level", 1, _to_int),
+    ("out_power", 2, _to_int),
+    ("in_power", 2, _to_int),
+    ("remain_display", 4, _to_timedelta_min),
+    ("car_out_state", 1, _to_int),
+    ("light_state", 1, _to_int),
+    ("beep", 1, _to_int),
+    ("typec_out1_power", 1, _to_int),
+    ("usb_out1_power", 1, _to_int),
+    ("usb_out2_power", 1, _to_int),
+    ("usbqc_out1_power", 1, _to_int),
+    ("car_out_power", 1, _to_int),
+    ("light_power", 1, _to_int),
+    ("typec_out1_temp", 1, _to_int),
+    ("car_out_temp", 1, _to_int),
+    ("standby_timeout", 2, _to_int),
+    ("car_in_energy", 4, _to_int),
+    ("mppt_in_energy", 4, _to_int),
+    ("ac_in_energy", 4, _to_int),
+    ("car_out_energy", 4, _to_int),
+    ("ac_out_energy", 4, _to_int),
+    ("usb_time", 4, _to_timedelta_sec),
+    ("usbqc_time", 4, _to_timedelta_sec),
+    ("typec_time", 4, _to_timedelta_sec),
+    ("car_out_time", 4, _to_timedelta_sec),
+    ("ac_out_time", 4, _to_timedelta_sec),
+    ("car_in_time", 4, _to_timedelta_sec),
+    ("mppt_time", 4, _to_timedelta_sec),
+]
 
 
 def parse_pd_river(d: bytes):
-    return _parse_dict(d, [
-        ("model", 1, _to_int),
-        ("pd_error", 4, _to_int),
-        ("pd_version", 4, _to_ver_reversed),
-        ("battery_level", 1, _to_int),
-        ("out_power", 2, _to_int),
-        ("in_power", 2, _to_int),
-        ("remain_display", 4, _to_timedelta_min),
-        ("car_out_state", 1, _to_int),
-        ("light_state", 1, _to_int),
-        ("beep", 1, _to_int),
-        ("typec_out1_power", 1, _to_int),
-        ("usb_out1_power", 1, _to_int),
-        ("usb_out2_power", 1, _to_int),
-        ("usbqc_out1_power", 1, _to_int),
-        ("car_out_power", 1, _to_int),
-        ("light_power", 1, _to_int),
-        ("typec_out1_temp", 1, _to_int),
-        ("car_out_temp", 1, _to_int),
-        ("standby_timeout", 2, _to_int),
-        ("car_in_energy", 4, _to_int),
-        ("mppt_in_energy", 4, _to_int),
-        ("ac_in_energy", 4, _to_int),
-        ("car_out_energy", 4, _to_int),
-        ("ac_out_energy", 4, _to_int),
-        ("usb_time", 4, _to_timedelta_sec),
-        ("usbqc_time", 4, _to_timedelta_sec),
-        ("typec_time", 4, _to_timedelta_sec),
-        ("car_out_time", 4, _to_timedelta_sec),
-        ("ac_out_time", 4, _to_timedelta_sec),
-        ("car_in_time", 4, _to_timedelta_sec),
-        ("mppt_time", 4, _to_timedelta_sec),
-    ])
+    return _parse_dict(d, _PD_RIVER)
 
 
 # def parse_pd_river_mini(d: bytes):
@@ -541,6 +586,21 @@ def parse_pd_river(d: bytes):
 #     ])
 
 
+_DELTA_TABLES = {
+    "bms": _BMS_DELTA,
+    "ems": _EMS_DELTA,
+    "inverter": _INVERTER_DELTA,
+    "mppt": _MPPT_DELTA,
+    "pd": _PD_DELTA,
+}
+_RIVER_TABLES = {
+    "bms": _BMS_RIVER,
+    "ems": _EMS_RIVER,
+    "inverter": _INVERTER_RIVER,
+    "pd": _PD_RIVER,
+}
+
+
 def parse_serial(d: bytes) -> Serial:
     return _parse_dict(d, [
         ("chk_val", 4, _to_int),
@@ -554,5 +614,5 @@ def parse_serial(d: bytes) -> Serial:
     ])
 
 
-def merge_packet():
-    return _merge_packet
+def merge_packet(emit: Callable[[bytes], Any]):
+    return _merge_packet(emit)
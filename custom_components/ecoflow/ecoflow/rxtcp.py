@@ -1,8 +1,21 @@
-from asyncio import Future, create_task, open_connection, sleep
+from asyncio import (Event, Future, StreamWriter, create_task,
+                     open_connection, sleep)
+from collections import deque
 from logging import getLogger
+from time import monotonic, perf_counter
 from typing import Optional
 
-from reactivex import Subject
+from .stream import Subject
+
+AGING_TIME = 2
+COMMAND_TTL = 30
+PRIORITY_INTERACTIVE = 0
+PRIORITY_AUTOMATION = 1
+PRIORITY_POLL = 2
+PRIORITY_BACKGROUND = 3
+# Requests of a class awaiting their reply, indexed by priority
+INFLIGHT_LIMITS = (4, 4, 1, 1)
+QUEUE_SIZE = 64
 
 _LOGGER = getLogger(__name__)
 
@@ -10,11 +23,19 @@ _LOGGER = getLogger(__name__)
 class RxTcpAutoConnection:
     __rx = None
     __tx = None
+    dropped = 0
+    failures = 0
+    received_at = 0.0
 
     def __init__(self, host: str, port: int):
         self.host = host
         self.port = port
         self.received = Subject[Optional[bytes]]()
+        # (deadline, queued, frame, until) per priority, kept across reconnects
+        self.__queues = tuple(
+            deque[tuple[float, float, bytes, Optional[Future]]]() for _ in INFLIGHT_LIMITS)
+        self.__inflight = [0] * len(INFLIGHT_LIMITS)
+        self.__pending = Event()
         self.__is_open = True
         self.__task = create_task(self.__loop())
         self.__opened = Future()
@@ -32,7 +53,8 @@ class RxTcpAutoConnection:
             self.__rx.feed_eof()
 
     async def drain(self):
-        await self.__tx.drain()
+        if self.__tx:
+            await self.__tx.drain()
 
     def reconnect(self):
         if self.__rx:
@@ -51,8 +73,66 @@ class RxTcpAutoConnection:
     async def wait_opened(self):
         await self.__opened
 
-    def write(self, data: bytes):
-        self.__tx.write(data)
+    def write(self, data: bytes, ttl: float = COMMAND_TTL, priority: int = PRIORITY_AUTOMATION, until: Optional[Future] = None):
+        if sum(len(x) for x in self.__queues) >= QUEUE_SIZE:
+            for queue in reversed(self.__queues):
+                if queue:
+                    queue.popleft()
+                    self.__drop("queue full")
+                    break
+        now = monotonic()
+        self.__queues[priority].append((now + ttl, now, data, until))
+        self.__pending.set()
+
+    def __next(self):
+        now = monotonic()
+        best = None
+        for (priority, queue) in enumerate(self.__queues):
+            while queue:
+                if now > queue[0][0]:
+                    self.__drop("expired")
+                # Polls answered while still queued aren't sent at all
+                elif not (queue[0][3] and queue[0][3].done()):
+                    break
+                queue.popleft()
+            if not queue or self.__inflight[priority] >= INFLIGHT_LIMITS[priority]:
+                continue
+            # Waiting commands move up a class every AGING_TIME seconds, but
+            # never above automation, so interactive commands always go first
+            rank = max(priority - (now - queue[0][1]) / AGING_TIME,
+                       min(priority, PRIORITY_AUTOMATION))
+            if best is None or rank < best[0]:
+                best = (rank, priority)
+        return best and best[1]
+
+    def __release(self, priority: int):
+        self.__inflight[priority] -= 1
+        self.__pending.set()
+
+    def __drop(self, reason: str):
+        self.dropped += 1
+        _LOGGER.warning(f"dropped command to {self.host}: {reason}")
+
+    async def __send(self, tx: StreamWriter):
+        while True:
+            await self.__pending.wait()
+            while (priority := self.__next()) is not None:
+                queue = self.__queues[priority]
+                item = queue[0]
+                tx.write(item[2])
+                try:
+                    await tx.drain()
+                except Exception as ex:
+                    # Left queued and replayed after reconnect
+                    _LOGGER.debug(ex)
+                    return
+                if queue and queue[0] is item:
+                    queue.popleft()
+                if (until := item[3]) and not until.done():
+                    self.__inflight[priority] += 1
+                    until.add_done_callback(
+                        lambda _, p=priority: self.__release(p))
+            self.__pending.clear()
 
     async def __loop(self):
         while self.__is_open:
@@ -61,15 +141,19 @@ class RxTcpAutoConnection:
                 (self.__rx, self.__tx) = await open_connection(self.host, self.port)
             except Exception as ex:
                 _LOGGER.debug(ex)
+                self.failures += 1
                 await sleep(1)
                 continue
             _LOGGER.debug(f"connected {self.host}")
+            self.failures = 0
             if not self.__opened.done():
                 self.__opened.set_result(None)
+            sender = create_task(self.__send(self.__tx))
             try:
                 while not self.__rx.at_eof():
                     data = await self.__rx.read(1024)
                     if data:
+                        self.received_at = perf_counter()
                         self.received.on_next(data)
             except Exception as ex:
                 if type(ex) is not TimeoutError:
@@ -78,6 +162,7 @@ class RxTcpAutoConnection:
                 self.received.on_error(ex)
                 return
             finally:
+                sender.cancel()
                 self.__rx.feed_eof()
                 self.__tx.close()
             self.received.on_next(None)
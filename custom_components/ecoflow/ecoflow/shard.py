@@ -0,0 +1,309 @@
+import asyncio
+import os
+import pickle
+import socket
+import struct
+from logging import getLogger
+from multiprocessing import get_context
+from multiprocessing.connection import Connection
+from time import monotonic
+from typing import Any, Optional
+from zlib import crc32
+
+from . import receive
+from .rxtcp import COMMAND_TTL, PRIORITY_AUTOMATION, RxTcpAutoConnection
+from .stream import Subject
+
+DROP_REPORT_INTERVAL = 1
+FLUSH_INTERVAL = 0.05
+KEYFRAME_INTERVAL = 5
+WRITE_BUFFER_LIMIT = 1 << 20
+
+# Length prefix of multiprocessing.Connection messages
+_HEADER = struct.Struct("!i")
+
+_LOGGER = getLogger(__name__)
+_STATES = (
+    (receive.is_pd, receive.parse_pd),
+    (receive.is_ems, receive.parse_ems),
+    (receive.is_inverter, receive.parse_inverter),
+    (receive.is_mppt, receive.parse_mppt),
+    (receive.is_bms, receive.parse_bms),
+)
+
+
+def _frame(msg: Any):
+    data = pickle.dumps(msg, pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(len(data)) + data
+
+
+class _Station:
+    def __init__(self, host: str, port: int, product: int, emit):
+        self.host = host
+        self.product = product
+        self.tcp = RxTcpAutoConnection(host, port)
+        self.__emit = emit
+        self.__last = dict[tuple, tuple[float, dict[str, Any]]]()
+        self.tcp.received.subscribe(self.__on_raw)
+        self.tcp.received.subscribe(receive.merge_packet(
+            lambda x: self.__on_packet(receive.decode_packet(x))))
+        asyncio.create_task(self.__opened())
+
+    async def __opened(self):
+        await self.tcp.wait_opened()
+        self.__emit(("o", self.host))
+
+    def __on_raw(self, data: Optional[bytes]):
+        if data is None:
+            self.__last.clear()
+            self.__emit(("e", self.host))
+
+    def __on_packet(self, x: tuple[int, int, int, bytes]):
+        for is_state, parse in _STATES:
+            if is_state(x):
+                break
+        else:
+            self.__emit(("p", self.host, x))
+            return
+        rec = parse(x[3], self.product)
+        idx = None
+        if type(rec) is tuple:
+            (idx, rec) = rec
+        key = (x[0], x[1], x[2], idx)
+        now = monotonic()
+        last = self.__last.get(key)
+        if last is None:
+            diff = rec
+        else:
+            diff = {k: v for (k, v) in rec.items() if last[1].get(k) != v}
+            if not diff and now - last[0] < KEYFRAME_INTERVAL:
+                return
+        self.__last[key] = (now, rec)
+        self.__emit(("s", self.host, key, diff))
+
+
+async def _serve(conn: Connection):
+    loop = asyncio.get_running_loop()
+    stations = dict[str, _Station]()
+    batch = list[tuple]()
+    closed = loop.create_future()
+
+    def flush():
+        if batch:
+            conn.send(list(batch))
+            batch.clear()
+
+    def emit(item: tuple):
+        if not batch:
+            loop.call_later(FLUSH_INTERVAL, flush)
+        batch.append(item)
+
+    def readable():
+        while conn.poll():
+            msg = conn.recv()
+            if msg is None:
+                if not closed.done():
+                    closed.set_result(None)
+                return
+            (cmd, host, *args) = msg
+            if cmd == "open":
+                stations[host] = _Station(host, args[0], args[1], emit)
+                continue
+            station = stations.get(host)
+            if station is None:
+                continue
+            if cmd == "write":
+                try:
+                    station.tcp.write(*args)
+                except Exception as ex:
+                    _LOGGER.debug(ex)
+            elif cmd == "reconnect":
+                station.tcp.reconnect()
+            elif cmd == "close":
+                station.tcp.close()
+                stations.pop(host)
+
+    async def report_drops():
+        reported = dict[str, int]()
+        while True:
+            await asyncio.sleep(DROP_REPORT_INTERVAL)
+            for (host, station) in stations.items():
+                if station.tcp.dropped != reported.get(host, 0):
+                    reported[host] = station.tcp.dropped
+                    emit(("d", host, station.tcp.dropped))
+
+    loop.add_reader(conn.fileno(), readable)
+    reporter = asyncio.create_task(report_drops())
+    await closed
+    reporter.cancel()
+    loop.remove_reader(conn.fileno())
+    for station in stations.values():
+        station.tcp.close()
+    for station in stations.values():
+        await station.tcp.wait_closed()
+
+
+def _worker_main(conn: Connection):
+    asyncio.run(_serve(conn))
+
+
+class ShardConnection:
+    def __init__(self, pool: "ShardPool", host: str, port: int):
+        self.host = host
+        self.port = port
+        self.received = Subject[tuple[int, int, int, Any]]()
+        self.__pool = pool
+        self.__dropped_local = 0
+        self.__dropped_worker = 0
+        self.__opened = asyncio.get_running_loop().create_future()
+        self.__states = dict[tuple, dict[str, Any]]()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+        await self.wait_closed()
+
+    def close(self):
+        self.__pool.release(self)
+        self.received.on_completed()
+
+    async def drain(self):
+        pass
+
+    def reconnect(self):
+        self.__pool.send(("reconnect", self.host))
+
+    async def wait_closed(self):
+        pass
+
+    async def wait_opened(self):
+        await self.__opened
+
+    @property
+    def dropped(self):
+        return self.__dropped_local + self.__dropped_worker
+
+    def write(self, data: bytes, ttl: float = COMMAND_TTL, priority: int = PRIORITY_AUTOMATION, until: Optional[asyncio.Future] = None):
+        # Replies are not tracked across processes, so requests are not held
+        # in flight
+        if not self.__pool.send(("write", self.host, data, ttl, priority)):
+            self.__dropped_local += 1
+
+    def _on_message(self, msg: tuple):
+        kind = msg[0]
+        if kind == "s":
+            (key, diff) = msg[2:]
+            state = {**self.__states.get(key, {}), **diff}
+            self.__states[key] = state
+            if key[3] is None:
+                self.received.on_next((*key[:3], state))
+            else:
+                self.received.on_next((*key[:3], (key[3], state)))
+        elif kind == "p":
+            self.received.on_next(msg[2])
+        elif kind == "e":
+            self.__states.clear()
+        elif kind == "d":
+            self.__dropped_worker = msg[2]
+        elif kind == "o":
+            if not self.__opened.done():
+                self.__opened.set_result(None)
+
+
+class ShardPool:
+    def __init__(self, size: int):
+        self.size = size
+        self.__conns = list[Connection]()
+        self.__procs = list()
+        self.__clients = dict[str, ShardConnection]()
+        self.__writers = list[asyncio.StreamWriter]()
+        self.__readers = list[asyncio.Task]()
+
+    def start(self):
+        ctx = get_context("spawn")
+        for i in range(self.size):
+            (parent, child) = ctx.Pipe()
+            proc = ctx.Process(
+                target=_worker_main,
+                args=(child,),
+                name=f"ecoflow_shard_{i}",
+                daemon=True,
+            )
+            proc.start()
+            child.close()
+            self.__conns.append(parent)
+            self.__procs.append(proc)
+
+    async def attach(self):
+        # The event loop talks to workers through non-blocking streams that
+        # speak the Connection framing, so a full pipe never stalls it
+        for conn in self.__conns:
+            sock = socket.socket(fileno=os.dup(conn.fileno()))
+            conn.close()
+            (reader, writer) = await asyncio.open_unix_connection(sock=sock)
+            self.__writers.append(writer)
+            self.__readers.append(asyncio.create_task(self.__read(reader)))
+        self.__conns.clear()
+
+    def stop(self):
+        for conn in self.__conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for proc in self.__procs:
+            proc.join(5)
+            if proc.is_alive():
+                proc.kill()
+        for conn in self.__conns:
+            conn.close()
+        self.__conns.clear()
+        self.__procs.clear()
+
+    def detach(self):
+        for task in self.__readers:
+            task.cancel()
+        for writer in self.__writers:
+            writer.write(_frame(None))
+            writer.close()
+        self.__readers.clear()
+        self.__writers.clear()
+
+    @property
+    def empty(self):
+        return not self.__clients
+
+    def connect(self, host: str, port: int, product: int):
+        client = ShardConnection(self, host, port)
+        self.__clients[host] = client
+        self.send(("open", host, port, product))
+        return client
+
+    def release(self, client: ShardConnection):
+        if self.__clients.get(client.host) is client:
+            self.__clients.pop(client.host)
+            self.send(("close", client.host))
+
+    def send(self, msg: tuple):
+        if not self.__writers:
+            return False
+        writer = self.__writers[crc32(msg[1].encode()) % self.size]
+        if writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+            _LOGGER.warning(f"shard worker is not reading, dropped {msg[0]}")
+            return False
+        writer.write(_frame(msg))
+        return True
+
+    async def __read(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                for msg in pickle.loads(await reader.readexactly(size)):
+                    client = self.__clients.get(msg[1])
+                    if client:
+                        client._on_message(msg)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            _LOGGER.error("shard worker exited")
+
@@ -0,0 +1,162 @@
+from asyncio import Future, get_running_loop
+from logging import getLogger
+from time import monotonic
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+_LOGGER = getLogger(__name__)
+_T = TypeVar("_T")
+_U = TypeVar("_U")
+
+
+def _noop(*args):
+    pass
+
+
+class Subscription:
+    __slots__ = ("_subject", "_observer")
+
+    def __init__(self, subject: "Subject", observer: tuple):
+        self._subject = subject
+        self._observer = observer
+
+    def dispose(self):
+        if self._subject is not None:
+            self._subject._remove(self._observer)
+            self._subject = None
+
+
+class Subject(Generic[_T]):
+    __slots__ = ("_observers",)
+
+    def __init__(self):
+        # Replaced on every change so dispatch can iterate without copying
+        self._observers: tuple[tuple[Callable, Callable, Callable], ...] = ()
+
+    def subscribe(self, on_next: Callable[[_T], Any] = None, on_error: Callable[[BaseException], Any] = None, on_completed: Callable[[], Any] = None):
+        observer = (on_next or _noop, on_error or _noop, on_completed or _noop)
+        self._observers += (observer,)
+        return Subscription(self, observer)
+
+    def _remove(self, observer: tuple):
+        self._observers = tuple(x for x in self._observers if x is not observer)
+
+    def on_next(self, value: _T):
+        for x in self._observers:
+            x[0](value)
+
+    def on_error(self, ex: BaseException):
+        for x in self._observers:
+            x[1](ex)
+
+    def on_completed(self):
+        for x in self._observers:
+            x[2]()
+
+    def filter(self, predicate: Callable[[_T], bool]) -> "Subject[_T]":
+        res = Subject[_T]()
+
+        def on_next(value: _T):
+            if predicate(value):
+                res.on_next(value)
+        self.subscribe(on_next, res.on_error, res.on_completed)
+        return res
+
+    def map(self, selector: Callable[[_T], _U]) -> "Subject[_U]":
+        res = Subject[_U]()
+        self.subscribe(
+            lambda x: res.on_next(selector(x)),
+            res.on_error,
+            res.on_completed,
+        )
+        return res
+
+
+class ReplaySubject(Subject[_T]):
+    __slots__ = ("window", "_value", "_time")
+
+    def __init__(self, window: float):
+        super().__init__()
+        self.window = window
+        self._value: Optional[_T] = None
+        self._time: Optional[float] = None
+
+    def subscribe(self, on_next: Callable[[_T], Any] = None, on_error: Callable[[BaseException], Any] = None, on_completed: Callable[[], Any] = None):
+        sub = super().subscribe(on_next, on_error, on_completed)
+        if on_next and self._time is not None and monotonic() - self._time <= self.window:
+            on_next(self._value)
+        return sub
+
+    def on_next(self, value: _T):
+        self._value = value
+        self._time = monotonic()
+        super().on_next(value)
+
+    def touch(self):
+        if self._time is not None:
+            self._time = monotonic()
+
+    def clear(self):
+        self._value = None
+        self._time = None
+
+
+class LatestSubject(Subject[_T]):
+    __slots__ = ("key", "dropped", "_pending")
+
+    def __init__(self, key: Callable[[_T], Any]):
+        super().__init__()
+        self.key = key
+        self.dropped = 0
+        self._pending: Optional[dict[Any, _T]] = None
+
+    def on_next(self, value: _T):
+        if self._pending is None:
+            self._pending = {}
+            get_running_loop().call_soon(self._drain)
+        k = self.key(value)
+        if self._pending.pop(k, None) is not None:
+            self.dropped += 1
+        self._pending[k] = value
+
+    def on_error(self, ex: BaseException):
+        self._drain()
+        super().on_error(ex)
+
+    def on_completed(self):
+        self._drain()
+        super().on_completed()
+
+    def _drain(self):
+        pending = self._pending
+        self._pending = None
+        if pending:
+            # Most recently updated first
+            for value in reversed(pending.values()):
+                # Already taken off _pending, so a failing subscriber must
+                # not lose the other frames
+                try:
+                    super().on_next(value)
+                except Exception:
+                    _LOGGER.exception("dispatching coalesced value failed")
+
+
+def first(src: Subject[_T], timeout: float, predicate: Optional[Callable[[_T], bool]] = None) -> "Future[_T]":
+    loop = get_running_loop()
+    fut = loop.create_future()
+
+    def on_next(value: _T):
+        if not fut.done() and (predicate is None or predicate(value)):
+            fut.set_result(value)
+
+    def on_error(ex: BaseException):
+        if not fut.done():
+            fut.set_exception(ex)
+
+    sub = src.subscribe(on_next, on_error, lambda: on_error(EOFError()))
+    timer = loop.call_later(timeout, on_error, TimeoutError())
+
+    def done(_):
+        sub.dispose()
+        timer.cancel()
+    fut.add_done_callback(done)
+    return fut
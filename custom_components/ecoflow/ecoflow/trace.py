@@ -0,0 +1,91 @@
+from bisect import bisect_left
+from logging import getLogger
+from time import perf_counter
+from typing import Any, Optional
+
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+STAGES = ("frame", "decode", "queue", "parse", "publish", "total")
+
+_LOGGER = getLogger(__name__)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        buckets = dict[str, int]()
+        total = 0
+        for (le, n) in zip(BUCKETS, self.counts):
+            total += n
+            buckets[f"{le * 1000:g}ms"] = total
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum_ms": round(self.sum * 1000, 3),
+            "buckets": buckets,
+        }
+
+
+class Tracer:
+    def __init__(self, sample: int, threshold: float):
+        self.sample = sample
+        self.threshold = threshold
+        self.histograms = {x: Histogram() for x in STAGES}
+        self.frame: Optional[Any] = None
+        self.writes = 0
+        self.__n = 0
+        self.__times = list[float]()
+
+    def sampled(self):
+        self.__n += 1
+        if self.__n < self.sample:
+            return False
+        self.__n = 0
+        return True
+
+    def begin(self, frame: Any, arrived: float, decoding: float):
+        self.frame = frame
+        self.writes = 0
+        self.__times = [arrived, decoding, perf_counter()]
+
+    def stamp(self):
+        self.__times.append(perf_counter())
+
+    def written(self):
+        if self.frame is not None:
+            self.writes += 1
+
+    def end(self):
+        frame = self.frame
+        self.frame = None
+        times = self.__times
+        times.append(perf_counter())
+        durations = [b - a for (a, b) in zip(times, times[1:])]
+        durations.append(times[-1] - times[0])
+        for (stage, value) in zip(STAGES, durations):
+            self.histograms[stage].observe(value)
+        if durations[-1] > self.threshold:
+            _LOGGER.warning(
+                f"frame {frame[0:3]} took {durations[-1] * 1000:.1f}ms (" +
+                ", ".join(f"{s} {v * 1000:.2f}ms" for (s, v) in zip(STAGES, durations[:-1])) +
+                f", {self.writes} state writes)")
+
+    def as_dict(self):
+        return {
+            "sample": self.sample,
+            "threshold_ms": self.threshold * 1000,
+            **{x: h.as_dict() for (x, h) in self.histograms.items()},
+        }
@@ -0,0 +1,139 @@
+import os
+import re
+import shutil
+from datetime import timedelta
+from logging import getLogger
+from queue import SimpleQueue
+from threading import Thread
+from time import localtime, monotonic, strftime, time
+from typing import Any, Optional
+
+import numpy as np
+
+from .ecoflow import receive
+
+EXPORT_DIR = "ecoflow_export"
+FLUSH_INTERVAL = 60
+FLUSH_ROWS = 1024
+STREAMS = ("pd", "ems", "inverter", "mppt", "bms")
+
+_LOGGER = getLogger(__name__)
+
+
+def _column(size: int, fn):
+    sample = fn(bytes(size))
+    if isinstance(sample, int):
+        return (np.int64, -1)
+    if isinstance(sample, (float, timedelta)):
+        return (np.float64, np.nan)
+    if isinstance(sample, str):
+        return (np.str_, "")
+    return None
+
+
+def _file_name(field: str):
+    return re.sub(r"\W", "_", field) + ".npy"
+
+
+def _value(v):
+    if isinstance(v, timedelta):
+        return v.total_seconds()
+    return v
+
+
+class _Batch:
+    def __init__(self, hour: str):
+        self.hour = hour
+        self.started = monotonic()
+        self.rows = list[tuple[float, dict[str, Any]]]()
+
+
+class TelemetryExporter:
+    def __init__(self, root: str, product: int, days: int):
+        self.root = root
+        self.days = days
+        self.__schemas = dict[str, list[tuple[str, Any, Any]]]()
+        for name in STREAMS:
+            schema = list[tuple[str, Any, Any]]()
+            for (field, size, fn) in receive.get_fields(name, product):
+                if column := _column(size, fn):
+                    schema.append((field, *column))
+            self.__schemas[name] = schema
+        self.__batches = dict[str, _Batch]()
+        self.__queue = SimpleQueue()
+        self.__pruned: Optional[str] = None
+        self.__thread = Thread(
+            target=self.__run, name="ecoflow_export", daemon=True)
+        self.__thread.start()
+
+    def append(self, name: str, data: Any):
+        if name == "bms":
+            stream = f"bms{data[0]}"
+            data = data[1]
+        else:
+            stream = name
+        now = time()
+        hour = strftime("%Y%m%d%H", localtime(now))
+        batch = self.__batches.get(stream)
+        if batch and batch.hour != hour:
+            self.__flush(stream)
+            batch = None
+        if batch is None:
+            batch = self.__batches[stream] = _Batch(hour)
+        batch.rows.append((now, data))
+        if len(batch.rows) >= FLUSH_ROWS or monotonic() - batch.started >= FLUSH_INTERVAL:
+            self.__flush(stream)
+
+    def flush_idle(self):
+        # Streams that went quiet would otherwise keep rows in memory
+        hour = strftime("%Y%m%d%H")
+        limit = monotonic() - FLUSH_INTERVAL
+        for (stream, batch) in list(self.__batches.items()):
+            if batch.hour != hour or batch.started <= limit:
+                self.__flush(stream)
+
+    def close(self):
+        for stream in list(self.__batches):
+            self.__flush(stream)
+        self.__queue.put(None)
+
+    def join(self):
+        self.__thread.join()
+
+    def __flush(self, stream: str):
+        batch = self.__batches.pop(stream)
+        schema = self.__schemas[stream.rstrip("0123456789")]
+        self.__queue.put((stream, batch.hour, schema, batch.rows))
+
+    def __run(self):
+        while (item := self.__queue.get()) is not None:
+            try:
+                self.__write(*item)
+            except Exception:
+                _LOGGER.exception(f"failed to export {item[0]}")
+
+    def __write(self, stream: str, hour: str, schema: list, rows: list):
+        base = os.path.join(self.root, stream, hour)
+        os.makedirs(base, exist_ok=True)
+        seq = sum(1 for x in os.scandir(base) if x.is_dir() and x.name.isdigit())
+        tmp = os.path.join(base, f"{seq:05d}.tmp")
+        os.makedirs(tmp, exist_ok=True)
+        np.save(os.path.join(tmp, "time.npy"),
+                np.fromiter((x[0] for x in rows), np.float64, len(rows)))
+        for (field, dtype, fill) in schema:
+            values = (_value(x[1].get(field)) for x in rows)
+            col = np.array([fill if v is None else v for v in values], dtype)
+            np.save(os.path.join(tmp, _file_name(field)), col)
+        os.replace(tmp, os.path.join(base, f"{seq:05d}"))
+        if self.__pruned != hour:
+            self.__pruned = hour
+            self.__prune(time() - self.days * 86400)
+
+    def __prune(self, cutoff: float):
+        limit = strftime("%Y%m%d%H", localtime(cutoff))
+        for stream in os.scandir(self.root):
+            if not stream.is_dir():
+                continue
+            for hour in os.scandir(stream.path):
+                if hour.name < limit:
+                    shutil.rmtree(hour.path, ignore_errors=True)
@@ -0,0 +1,133 @@
+from datetime import timedelta
+from typing import Any, Callable, Hashable, Optional
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import event
+from homeassistant.util.dt import utcnow
+
+from .ecoflow.stream import Subject
+
+FLEET_INTERVAL = timedelta(seconds=5)
+
+
+class Sum:
+    __slots__ = ("total", "parts")
+
+    def __init__(self):
+        self.total = 0
+        self.parts = dict[Hashable, Any]()
+
+    def set(self, key: Hashable, value):
+        self.total += value - self.parts.get(key, 0)
+        self.parts[key] = value
+
+    def remove(self, key: Hashable):
+        self.total -= self.parts.pop(key, 0)
+
+
+class Fleet:
+    def __init__(self, hass: HomeAssistant):
+        self.in_power = Sum()
+        self.out_power = Sum()
+        self.in_energy = Sum()
+        self.out_energy = Sum()
+        self.remain_capacity = Sum()
+        self.full_capacity = Sum()
+        self.last_reset = utcnow()
+        self.updated = Subject[None]()
+        self.__dirty = False
+        self.__members = dict[str, list[Callable[[], None]]]()
+        self.__adders = dict[str, Callable[[], None]]()
+        self.__owner: Optional[str] = None
+        self.__timer = event.async_track_time_interval(
+            hass, self.__publish, FLEET_INTERVAL)
+
+    @property
+    def empty(self):
+        return not self.__members
+
+    @property
+    def energy_complete(self):
+        return all(x in self.in_energy.parts for x in self.__members)
+
+    @property
+    def battery_level(self):
+        if self.full_capacity.total <= 0:
+            return None
+        return round(self.remain_capacity.total * 100 / self.full_capacity.total, 1)
+
+    def join(self, client):
+        serial = client.serial
+
+        def pd_updated(data: dict[str, Any]):
+            self.in_power.set(serial, data["in_power"])
+            self.out_power.set(serial, data["out_power"])
+            self.in_energy.set(serial, data.get("in_energy", 0))
+            self.out_energy.set(serial, data.get("out_energy", 0))
+            self.__dirty = True
+
+        def capacity(key: Hashable, data: dict[str, Any]):
+            if "battery_capacity_full" in data:
+                self.remain_capacity.set(key, data["battery_capacity_remain"])
+                self.full_capacity.set(key, data["battery_capacity_full"])
+                self.__dirty = True
+
+        def drop_capacity(key: Hashable):
+            self.remain_capacity.remove(key)
+            self.full_capacity.remove(key)
+            self.__dirty = True
+
+        def disconnected(idx: Optional[int]):
+            if idx is not None:
+                return
+            self.in_power.remove(serial)
+            self.out_power.remove(serial)
+            drop_capacity((serial, "ems"))
+            self.__dirty = True
+
+        self.__members[serial] = [
+            client.pd.subscribe(pd_updated).dispose,
+            client.ems.subscribe(
+                lambda data: capacity((serial, "ems"), data)).dispose,
+            client.bms.subscribe(
+                lambda x: capacity((serial, x[0]), x[1])).dispose,
+            client.pack_detached.subscribe(
+                lambda idx: drop_capacity((serial, idx))).dispose,
+            client.disconnected.subscribe(disconnected).dispose,
+        ]
+        self.last_reset = utcnow()
+
+    def leave(self, serial: str):
+        for dispose in self.__members.pop(serial, ()):
+            dispose()
+        self.in_power.remove(serial)
+        self.out_power.remove(serial)
+        # The energy totals start a new cycle whenever membership changes
+        self.in_energy.remove(serial)
+        self.out_energy.remove(serial)
+        self.last_reset = utcnow()
+        for part in [x for x in self.full_capacity.parts if x[0] == serial]:
+            self.remain_capacity.remove(part)
+            self.full_capacity.remove(part)
+        self.__dirty = True
+        self.__adders.pop(serial, None)
+        if self.__owner == serial:
+            self.__owner = None
+            self.__adopt()
+        if self.empty:
+            self.__timer()
+
+    def own(self, serial: str, add_entities: Callable[[], None]):
+        self.__adders[serial] = add_entities
+        self.__adopt()
+
+    def __adopt(self):
+        # Aggregate entities live on one member entry and move on unload
+        if self.__owner is None and self.__adders:
+            self.__owner = next(iter(self.__adders))
+            self.__adders[self.__owner]()
+
+    def __publish(self, now):
+        if self.__dirty:
+            self.__dirty = False
+            self.updated.on_next(None)
@@ -0,0 +1,106 @@
+import os
+import re
+from datetime import timedelta
+from time import time
+from typing import Any, Optional
+
+import numpy as np
+
+HISTORY_DIR = "ecoflow_history"
+# Longer gaps between samples are outages, as stations report every second
+# or so while connected
+MAX_GAP = 15
+
+_FIELD = re.compile(r"^(pd|ems|inverter|mppt|bms\d+)\.(\w+)$")
+
+
+def parse_fields(value: str):
+    res = list[str]()
+    for x in re.split(r"[\s,]+", value.strip()):
+        if not x:
+            continue
+        if not _FIELD.match(x):
+            raise ValueError(x)
+        if x not in res:
+            res.append(x)
+    return res
+
+
+class RingBuffer:
+    def __init__(self, size: int, path: Optional[str] = None):
+        self.path = path
+        if path:
+            exists = os.path.exists(path) and os.path.getsize(path) == size * 16
+            self.data = np.memmap(path, np.float64, "r+" if exists else "w+",
+                                  shape=(size, 2))
+            if not exists:
+                self.data[:] = np.nan
+        else:
+            self.data = np.full((size, 2), np.nan)
+        times = self.data[:, 0]
+        if np.isnan(times).all():
+            self.pos = 0
+        else:
+            self.pos = (int(np.nanargmax(times)) + 1) % size
+
+    def append(self, t: float, v: float):
+        self.data[self.pos] = (t, v)
+        self.pos = (self.pos + 1) % len(self.data)
+
+    def flush(self):
+        if self.path:
+            self.data.flush()
+
+    def window(self, start: float):
+        sel = self.data[self.data[:, 0] >= start]
+        return sel[np.argsort(sel[:, 0], kind="stable")]
+
+
+class History:
+    def __init__(self, fields: list[str], size: int, path: Optional[str] = None):
+        if path:
+            os.makedirs(path, exist_ok=True)
+        self.buffers = dict[str, RingBuffer]()
+        self.__streams = dict[str, list[tuple[str, RingBuffer]]]()
+        for field in fields:
+            buf = self.buffers[field] = RingBuffer(
+                size, path and os.path.join(path, f"{field}.f64"))
+            (stream, key) = field.split(".", 1)
+            self.__streams.setdefault(stream, []).append((key, buf))
+
+    def append(self, name: str, data: Any):
+        if name == "bms":
+            name = f"bms{data[0]}"
+            data = data[1]
+        if not (targets := self.__streams.get(name)):
+            return
+        now = time()
+        for (key, buf) in targets:
+            v = data.get(key)
+            if isinstance(v, timedelta):
+                v = v.total_seconds()
+            if isinstance(v, (int, float)):
+                buf.append(now, v)
+
+    def flush(self):
+        for buf in self.buffers.values():
+            buf.flush()
+
+    def query(self, field: str, window: float, percentiles: list[float]):
+        sel = self.buffers[field].window(time() - window)
+        (t, v) = (sel[:, 0], sel[:, 1])
+        res = dict[str, Any](count=len(v))
+        if not len(v):
+            return res
+        res["mean"] = float(v.mean())
+        res["min"] = float(v.min())
+        res["max"] = float(v.max())
+        # Trapezoidal integral per hour, so W gives Wh, leaving out outages
+        dt = np.diff(t)
+        dt[dt > MAX_GAP] = 0
+        res["integral"] = float(np.sum((v[1:] + v[:-1]) * dt) / 2 / 3600)
+        if percentiles:
+            res["percentiles"] = {
+                p: float(x) for (p, x) in zip(percentiles, np.percentile(v, percentiles))
+            }
+        return res
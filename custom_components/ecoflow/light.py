@@ -7,8 +7,8 @@ from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity import EntityCategory
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
-from . import DOMAIN, EcoFlowEntity, HassioEcoFlowClient, select_bms
-from .ecoflow import is_river, send
+from . import DOMAIN, EcoFlowEntity, HassioEcoFlowClient
+from .ecoflow import send
 
 _EFFECTS = ["Low", "High", "SOS"]
 
@@ -17,14 +17,14 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
     client: HassioEcoFlowClient = hass.data[DOMAIN][entry.entry_id]
     entities = []
 
-    if is_river(client.product):
+    if "light" in client.capabilities["commands"]:
         entities.extend([
             LedEntity(client, client.pd, "light_state", "Light"),
         ])
-        if client.product == 5:  # RIVER Max
+        if "ambient" in client.capabilities["commands"]:
             entities.extend([
-                AmbientEntity(client, client.bms.pipe(
-                    select_bms(1)), "ambient", "Ambient light", 1),
+                AmbientEntity(client, client.pack(1).received,
+                              "ambient", "Ambient light", 1),
             ])
 
     async_add_entities(entities)
@@ -39,7 +39,7 @@ class AmbientEntity(LightEntity, EcoFlowEntity):
     _last_mode = 1
 
     async def async_turn_off(self, **kwargs):
-        self._client.tcp.write(send.set_ambient(0))
+        self._write(send.set_ambient(0))
 
     async def async_turn_on(self, brightness=None, rgb_color=None, effect=None, **kwargs):
         if brightness is None:
@@ -58,7 +58,7 @@ class AmbientEntity(LightEntity, EcoFlowEntity):
         else:
             effect = self._attr_effect_list.index(effect)
 
-        self._client.tcp.write(send.set_ambient(
+        self._write(send.set_ambient(
             self._last_mode, effect, rgb_color, brightness))
 
     def _on_updated(self, data: dict[str, Any]):
@@ -91,10 +91,10 @@ class LedEntity(LightEntity, EcoFlowEntity):
             self._attr_effect = None
 
     async def async_turn_off(self, **kwargs):
-        self._client.tcp.write(send.set_light(self._client.product, 0))
+        self._write(send.set_light(self._client.product, 0))
 
     async def async_turn_on(self, effect: str = None, **kwargs):
         if not effect:
             effect = self.effect or _EFFECTS[0]
-        self._client.tcp.write(send.set_light(
+        self._write(send.set_light(
             self._client.product, _EFFECTS.index(effect) + 1))
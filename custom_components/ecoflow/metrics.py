@@ -0,0 +1,103 @@
+from datetime import timedelta
+from time import monotonic
+from typing import Any, Callable, Iterable, Optional
+
+from aiohttp import web
+from homeassistant.components.http import HomeAssistantView
+
+CACHE_TIME = 5
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+_GAUGES = ("pd", "ems", "inverter", "mppt", "bms")
+_COUNTERS = ("frames", "dropped_frames", "skipped_frames", "reconnects", "dropped_commands")
+_FAMILIES = (
+    *((f"ecoflow_{x}", "gauge") for x in _GAUGES),
+    ("ecoflow_connected", "gauge"),
+    *((f"ecoflow_{x}", "counter") for x in _COUNTERS),
+)
+
+
+def _escape(value: str):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(v: Any):
+    t = type(v)
+    if t is int or t is float:
+        return v
+    if t is timedelta:
+        return v.total_seconds()
+    return None
+
+
+def _samples(family: str, labels: str, data: dict[str, Any]):
+    lines = list[str]()
+    for (k, v) in data.items():
+        if (v := _number(v)) is not None:
+            lines.append(f'{family}{{{labels},field="{k}"}} {v}\n')
+    return "".join(lines)
+
+
+def _render_records(client, labels: str) -> dict[str, str]:
+    res = dict[str, str]()
+    for name in _GAUGES:
+        data = client.diagnostics.get(name)
+        if not data:
+            continue
+        family = f"ecoflow_{name}"
+        if name == "bms":
+            res[family] = "".join(
+                _samples(family, f'{labels},pack="{idx}"', d) for (idx, d) in data.items())
+        else:
+            res[family] = _samples(family, labels, data)
+    return res
+
+
+def _render_link(client, labels: str) -> dict[str, str]:
+    return {
+        "ecoflow_connected": f"ecoflow_connected{{{labels}}} {int(client.connected)}\n",
+        "ecoflow_frames": f"ecoflow_frames_total{{{labels}}} {client.frames}\n",
+        "ecoflow_dropped_frames": f"ecoflow_dropped_frames_total{{{labels}}} {client.latest.dropped}\n",
+        "ecoflow_skipped_frames": f"ecoflow_skipped_frames_total{{{labels}}} {client.skipped}\n",
+        "ecoflow_reconnects": f"ecoflow_reconnects_total{{{labels}}} {client.reconnects}\n",
+        "ecoflow_dropped_commands": f"ecoflow_dropped_commands_total{{{labels}}} {client.tcp.dropped}\n",
+    }
+
+
+class MetricsView(HomeAssistantView):
+    url = "/api/ecoflow/metrics"
+    name = "api:ecoflow:metrics"
+
+    def __init__(self, clients: Callable[[], Iterable[Any]]):
+        self.__clients = clients
+        self.__body = b""
+        self.__time: Optional[float] = None
+        self.__records = dict[str, tuple[int, dict[str, str]]]()
+
+    async def get(self, request: web.Request):
+        now = monotonic()
+        if self.__time is None or now - self.__time >= CACHE_TIME:
+            self.__time = now
+            self.__body = self.render().encode()
+        return web.Response(body=self.__body, headers={"Content-Type": CONTENT_TYPE})
+
+    def render(self):
+        blocks = dict[str, dict[str, str]]()
+        for client in self.__clients():
+            labels = f'serial="{_escape(client.serial)}"'
+            cached = self.__records.get(client.serial)
+            if cached is None or cached[0] != client.version:
+                cached = self.__records[client.serial] = (
+                    client.version, _render_records(client, labels))
+            blocks[client.serial] = {
+                **cached[1], **_render_link(client, labels)}
+        for serial in list(self.__records):
+            if serial not in blocks:
+                self.__records.pop(serial)
+        out = list[str]()
+        for (family, kind) in _FAMILIES:
+            out.append(f"# TYPE {family} {kind}\n")
+            for block in blocks.values():
+                out.append(block.get(family, ""))
+        out.append("# EOF\n")
+        return "".join(out)
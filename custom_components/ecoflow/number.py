@@ -33,7 +33,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
                 MinLevelEntity(client, client.ems,
                             "battery_level_min", "Discharge level"),
             ])
-            if is_delta_pro(client.product):
+            if "generate" in client.capabilities["commands"]:
                 entities.extend([
                     GenerateStartEntity(
                         client, client.ems, "generator_level_start", "Smart generator auto on"),
@@ -59,7 +59,7 @@ class ChargeWattsEntity(BaseEntity):
     _attr_native_unit_of_measurement = POWER_WATT
 
     async def async_set_native_value(self, value: float):
-        self._client.tcp.write(send.set_ac_in_limit(int(value)))
+        self._write(send.set_ac_in_limit(int(value)))
 
     def _on_updated(self, data: dict[str, Any]):
         super()._on_updated(data)
@@ -102,7 +102,7 @@ class DcInCurrentEntity(NumberEntity, EcoFlowConfigEntity):
     _attr_native_unit_of_measurement = ELECTRIC_CURRENT_AMPERE
 
     async def async_set_native_value(self, value: float):
-        self._client.tcp.write(send.set_dc_in_current(
+        self._write(send.set_dc_in_current(
             self._client.product, int(value * 1000)))
 
     async def async_update(self):
@@ -123,7 +123,7 @@ class GenerateStartEntity(BaseEntity):
     _attr_native_unit_of_measurement = PERCENTAGE
 
     async def async_set_native_value(self, value: float):
-        self._client.tcp.write(send.set_generate_start(int(value)))
+        self._write(send.set_generate_start(int(value)))
 
 
 class GenerateStopEntity(BaseEntity):
@@ -134,7 +134,7 @@ class GenerateStopEntity(BaseEntity):
     _attr_native_unit_of_measurement = PERCENTAGE
 
     async def async_set_native_value(self, value: float):
-        self._client.tcp.write(send.set_generate_stop(int(value)))
+        self._write(send.set_generate_stop(int(value)))
 
 
 class LcdBrightnessEntity(BaseEntity):
@@ -148,7 +148,7 @@ class LcdBrightnessEntity(BaseEntity):
         self._attr_native_value = data[self._key] & 0x7F
 
     async def async_set_native_value(self, value: float):
-        self._client.tcp.write(send.set_lcd(
+        self._write(send.set_lcd(
             self._client.product, light=int(value)))
 
 
@@ -160,7 +160,7 @@ class MaxLevelEntity(BaseEntity):
     _attr_native_unit_of_measurement = PERCENTAGE
 
     async def async_set_native_value(self, value: float):
-        self._client.tcp.write(send.set_level_max(
+        self._write(send.set_level_max(
             self._client.product, int(value)))
 
 
@@ -172,4 +172,4 @@ class MinLevelEntity(BaseEntity):
     _attr_native_unit_of_measurement = PERCENTAGE
 
     async def async_set_native_value(self, value: float):
-        self._client.tcp.write(send.set_level_min(int(value)))
+        self._write(send.set_level_min(int(value)))
@@ -0,0 +1,124 @@
+import os
+import sys
+from cProfile import Profile
+from collections import Counter
+from io import StringIO
+from logging import getLogger
+from pstats import Stats
+from threading import Event, Thread, get_ident
+from time import strftime
+from typing import Optional
+
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.event import async_call_later
+
+MODE_DETERMINISTIC = "deterministic"
+MODE_SAMPLING = "sampling"
+
+_LOGGER = getLogger(__name__)
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _is_own(filename: str):
+    return filename.startswith(_ROOT)
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.relpath(code.co_filename, _ROOT)}:{code.co_firstlineno})"
+
+
+class _Sampler(Thread):
+    def __init__(self, ident: int, interval: float):
+        super().__init__(name="ecoflow_profiler", daemon=True)
+        self.samples = Counter[str]()
+        self.leaves = Counter[str]()
+        self.__ident = ident
+        self.__interval = interval
+        self.__stop = Event()
+
+    def run(self):
+        while not self.__stop.wait(self.__interval):
+            frame = sys._current_frames().get(self.__ident)
+            stack = list[str]()
+            leaf = None
+            while frame is not None:
+                code = frame.f_code
+                if _is_own(code.co_filename):
+                    name = _frame_name(code)
+                    stack.append(name)
+                    if leaf is None:
+                        leaf = name
+                frame = frame.f_back
+            if leaf is None:
+                continue
+            self.samples[";".join(reversed(stack))] += 1
+            self.leaves[leaf] += 1
+
+    def stop(self):
+        self.__stop.set()
+        self.join()
+
+
+class PipelineProfiler:
+    def __init__(self, hass: HomeAssistant):
+        self.__hass = hass
+        self.__profile: Optional[Profile] = None
+        self.__sampler: Optional[_Sampler] = None
+
+    @property
+    def running(self):
+        return self.__profile is not None or self.__sampler is not None
+
+    def start(self, duration: float, mode: str, interval: float):
+        if self.running:
+            raise HomeAssistantError("Profiler is already running")
+        if mode == MODE_SAMPLING:
+            self.__sampler = _Sampler(get_ident(), interval)
+            self.__sampler.start()
+        else:
+            self.__profile = Profile()
+            self.__profile.enable()
+        _LOGGER.info(f"profiling started ({mode}, {duration}s)")
+        async_call_later(self.__hass, duration, self.__stopped)
+
+    async def __stopped(self, *args):
+        path = self.__hass.config.path(
+            f"ecoflow_profile_{strftime('%Y%m%d_%H%M%S')}")
+        if self.__profile:
+            profile = self.__profile
+            profile.disable()
+            self.__profile = None
+            summary = await self.__hass.async_add_executor_job(
+                _write_pstats, profile, f"{path}.prof")
+        else:
+            sampler = self.__sampler
+            await self.__hass.async_add_executor_job(sampler.stop)
+            self.__sampler = None
+            summary = await self.__hass.async_add_executor_job(
+                _write_collapsed, sampler, f"{path}.collapsed")
+        _LOGGER.info(f"profiling finished\n{summary}")
+
+
+def _write_pstats(profile: Profile, path: str):
+    profile.create_stats()
+    profile.stats = {
+        k: v for k, v in profile.stats.items() if _is_own(k[0])
+    }
+    profile.dump_stats(path)
+    out = StringIO()
+    out.write(f"saved to {path}\n")
+    Stats(profile, stream=out).strip_dirs().sort_stats(
+        "cumulative").print_stats(25)
+    return out.getvalue()
+
+
+def _write_collapsed(sampler: _Sampler, path: str):
+    with open(path, "w") as f:
+        for stack, count in sampler.samples.items():
+            f.write(f"{stack} {count}\n")
+    total = sum(sampler.leaves.values())
+    lines = [f"saved to {path}", f"{total} samples"]
+    for name, count in sampler.leaves.most_common(25):
+        lines.append(f"{count:8d} {count * 100 / total:5.1f}% {name}")
+    return "\n".join(lines)
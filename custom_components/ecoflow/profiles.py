@@ -0,0 +1,87 @@
+import asyncio
+from typing import Any, Callable, NamedTuple
+
+import voluptuous as vol
+
+from .ecoflow import send
+from .ecoflow.stream import first
+
+
+class _Setting(NamedTuple):
+    command: str
+    encode: Callable[[int, Any], bytes]
+    stream: str
+    key: str
+    expect: Callable[[Any], Any]
+
+
+SETTINGS: dict[str, _Setting] = {
+    "ac_in_limit": _Setting("ac_in_limit", lambda p, v: send.set_ac_in_limit(v), "inverter", "ac_in_limit_custom", int),
+    "ac_timeout": _Setting("ac_timeout", lambda p, v: send.set_ac_timeout(v), "inverter", "ac_out_timeout", int),
+    "beep": _Setting("beep", lambda p, v: send.set_beep(v), "pd", "beep", lambda v: 0 if v else 1),
+    "level_max": _Setting("level_max", send.set_level_max, "ems", "battery_level_max", int),
+    "level_min": _Setting("level_min", lambda p, v: send.set_level_min(v), "ems", "battery_level_min", int),
+    "standby_timeout": _Setting("standby_timeout", lambda p, v: send.set_standby_timeout(v), "pd", "standby_timeout", int),
+    "xboost": _Setting("xboost", lambda p, v: send.set_ac_out(p, xboost=v), "inverter", "ac_out_xboost", int),
+}
+
+SETTINGS_SCHEMA = vol.Schema({
+    vol.Optional("ac_in_limit"): vol.All(vol.Coerce(int), vol.Range(min=200, max=3000)),
+    vol.Optional("ac_timeout"): vol.All(vol.Coerce(int), vol.Range(min=0, max=65535)),
+    vol.Optional("beep"): bool,
+    vol.Optional("level_max"): vol.All(vol.Coerce(int), vol.Range(min=30, max=100)),
+    vol.Optional("level_min"): vol.All(vol.Coerce(int), vol.Range(min=0, max=30)),
+    vol.Optional("standby_timeout"): vol.All(vol.Coerce(int), vol.Range(min=0, max=65535)),
+    vol.Optional("xboost"): bool,
+})
+
+
+def encode(settings: dict[str, Any], product: int, commands: frozenset[str]):
+    frames = dict[str, tuple[bytes, _Setting]]()
+    for (name, value) in settings.items():
+        setting = SETTINGS[name]
+        if setting.command in commands:
+            frames[name] = (setting.encode(product, value), setting)
+    return frames
+
+
+async def _apply(client, settings: dict[str, Any], frames: dict[str, tuple[bytes, _Setting]], timeout: float):
+    if not client.connected:
+        return {x: "disconnected" for x in settings}
+    res = {x: "unsupported" for x in settings if x not in frames}
+    waits = dict[str, asyncio.Future]()
+    for (name, (frame, setting)) in frames.items():
+        expected = setting.expect(settings[name])
+        waits[name] = first(
+            getattr(client, setting.stream), timeout,
+            lambda d, k=setting.key, v=expected: d.get(k) == v)
+        try:
+            client.tcp.write(frame)
+        except Exception as ex:
+            waits.pop(name).cancel()
+            res[name] = f"error: {ex}"
+    results = await asyncio.gather(*waits.values(), return_exceptions=True)
+    for (name, result) in zip(waits, results):
+        if isinstance(result, TimeoutError):
+            res[name] = "timeout"
+        elif isinstance(result, BaseException):
+            res[name] = f"error: {result!r}"
+        else:
+            res[name] = "ok"
+    return res
+
+
+async def apply_profile(clients: list, settings: dict[str, Any], parallel: int, timeout: float):
+    # Frames only depend on the product, so encode once per product type
+    encoded = dict[int, dict[str, tuple[bytes, _Setting]]]()
+    for client in clients:
+        if client.product not in encoded:
+            encoded[client.product] = encode(
+                settings, client.product, client.capabilities["commands"])
+    sem = asyncio.Semaphore(parallel)
+
+    async def run(client):
+        async with sem:
+            return await _apply(client, settings, encoded[client.product], timeout)
+    results = await asyncio.gather(*(run(x) for x in clients))
+    return {x.serial: r for (x, r) in zip(clients, results)}
@@ -90,7 +90,7 @@ class AcTimeoutEntity(SelectEntity, EcoFlowEntity):
     _attr_options = list(_AC_OPTIONS.keys())
 
     async def async_select_option(self, option: str):
-        self._client.tcp.write(send.set_ac_timeout(_AC_OPTIONS[option]))
+        self._write(send.set_ac_timeout(_AC_OPTIONS[option]))
 
     def _on_updated(self, data: dict[str, Any]):
         value = data[self._key]
@@ -111,7 +111,7 @@ class DcInTypeEntity(SelectEntity, EcoFlowConfigEntity):
         return _DC_ICONS.get(self.current_option, None)
 
     async def async_select_option(self, option: str):
-        self._client.tcp.write(send.set_dc_in_type(
+        self._write(send.set_dc_in_type(
             self._client.product, _DC_IMPUTS[option]))
 
     async def async_update(self):
@@ -133,7 +133,7 @@ class FreqEntity(SelectEntity, EcoFlowEntity):
     _attr_unit_of_measurement = FREQUENCY_HERTZ
 
     async def async_select_option(self, option: str):
-        self._client.tcp.write(send.set_ac_out(
+        self._write(send.set_ac_out(
             self._client.product, freq=_FREQS[option]))
 
     def _on_updated(self, data: dict[str, Any]):
@@ -150,7 +150,7 @@ class LcdTimeoutPollEntity(SelectEntity, EcoFlowConfigEntity):
     _req = send.get_lcd()
 
     async def async_select_option(self, option: str):
-        self._client.tcp.write(send.set_lcd(
+        self._write(send.set_lcd(
             self._client.product, time=_LCD_OPTIONS[option]))
 
     async def async_update(self):
@@ -171,7 +171,7 @@ class LcdTimeoutPushEntity(SelectEntity, EcoFlowEntity):
     _attr_options = list(_LCD_OPTIONS.keys())
 
     async def async_select_option(self, option: str):
-        self._client.tcp.write(send.set_lcd(
+        self._write(send.set_lcd(
             self._client.product, time=_LCD_OPTIONS[option]))
 
     def _on_updated(self, data: dict[str, Any]):
@@ -187,7 +187,7 @@ class StandbyTimeoutEntity(SelectEntity, EcoFlowEntity):
     _attr_options = list(_STANDBY_OPTIONS.keys())
 
     async def async_select_option(self, option: str):
-        self._client.tcp.write(
+        self._write(
             send.set_standby_timeout(_STANDBY_OPTIONS[option]))
 
     def _on_updated(self, data: dict[str, Any]):
@@ -1,23 +1,25 @@
 from datetime import timedelta
-from typing import Any, Optional, Union
+from typing import Any, Optional
 
-import reactivex.operators as ops
 from homeassistant.components.sensor import (SensorDeviceClass, SensorEntity,
                                              SensorStateClass)
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import (ELECTRIC_CURRENT_AMPERE,
                                  ELECTRIC_POTENTIAL_VOLT, ENERGY_WATT_HOUR,
                                  FREQUENCY_HERTZ, PERCENTAGE, POWER_WATT,
-                                 TEMP_CELSIUS)
+                                 STATE_UNAVAILABLE, TEMP_CELSIUS)
 from homeassistant.core import HomeAssistant
-from homeassistant.helpers.entity import EntityCategory
+from homeassistant.helpers.device_registry import DeviceEntryType
+from homeassistant.helpers.entity import DeviceInfo, EntityCategory
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.util.dt import utcnow
-from reactivex import Observable
 
-from . import DOMAIN, EcoFlowEntity, HassioEcoFlowClient, select_bms
+from . import (DOMAIN, BmsPack, EcoFlowEntity, HassioEcoFlowClient,
+               track_extra_packs)
 from .ecoflow import (is_delta, is_delta_mini, is_delta_pro, is_power_station,
                       is_river)
+from .ecoflow.stream import Subject
+from .fleet import Fleet, Sum
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback):
@@ -60,26 +62,23 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
                         "USB-A right output"),
         ])
         if is_delta(client.product):
-            bms = (
-                client.bms.pipe(select_bms(0), ops.share()),
-                client.bms.pipe(select_bms(1), ops.share()),
-                client.bms.pipe(select_bms(2), ops.share()),
-            )
+            main = client.pack(0)
             entities.extend([
                 CurrentEntity(client, client.mppt, "dc_in_current",
                               "DC input current"),
-                CyclesEntity(
-                    client, bms[0], "battery_cycles", "Main battery cycles", 0),
+                CyclesEntity(client, main.received, "battery_cycles",
+                             "Main battery cycles", 0),
                 RemainEntity(client, client.ems,
                              "battery_remain_charge", "Remain charge"),
                 RemainEntity(client, client.ems,
                              "battery_remain_discharge", "Remain discharge"),
-                SingleLevelEntity(
-                    client, bms[0], "battery_level_f32", "Main battery", 0),
+                SingleLevelEntity(client, main.received, "battery_level_f32",
+                                  "Main battery", 0),
                 TempEntity(client, client.inverter, "ac_out_temp",
                            "AC temperature"),
-                TempEntity(client, bms[0], "battery_temp",
+                TempEntity(client, main.received, "battery_temp",
                            "Main battery temperature", 0),
+                *_health_entities(client, main, "Main battery"),
                 TempEntity(client, client.mppt, "dc_in_temp",
                            "DC input temperature"),
                 TempEntity(client, client.mppt, "dc24_temp",
@@ -108,18 +107,6 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
                 ])
             else:
                 entities.extend([
-                    CyclesEntity(
-                        client, bms[1], "battery_cycles", "Extra1 battery cycles", 1),
-                    CyclesEntity(
-                        client, bms[2], "battery_cycles", "Extra2 battery cycles", 2),
-                    SingleLevelEntity(
-                        client, bms[1], "battery_level_f32", "Extra1 battery", 1),
-                    SingleLevelEntity(
-                        client, bms[2], "battery_level_f32", "Extra2 battery", 2),
-                    TempEntity(client, bms[1], "battery_temp",
-                               "Extra1 battery temperature", 1),
-                    TempEntity(client, bms[2], "battery_temp",
-                               "Extra2 battery temperature", 2),
                     WattsEntity(client, client.pd, "usbqc_out1_power",
                                 "USB-Fast left output"),
                     WattsEntity(client, client.pd, "usbqc_out2_power",
@@ -135,26 +122,19 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
                                 "anderson_out_power", "Anderson output"),
                 ])
         if is_river(client.product):
-            extra = client.bms.pipe(select_bms(1), ops.share())
             entities.extend([
                 CurrentEntity(client, client.inverter, "dc_in_current",
                               "DC input current"),
                 CyclesEntity(client, client.ems, "battery_cycles",
                              "Main battery cycles"),
-                CyclesEntity(client, extra, "battery_cycles",
-                             "Extra battery cycles", 1),
                 SingleLevelEntity(client, client.ems, "battery_main_level",
                             "Main battery"),
-                SingleLevelEntity(
-                    client, extra, "battery_level", "Extra battery", 1),
                 TempEntity(client, client.inverter, "ac_in_temp",
                            "AC input temperature"),
                 TempEntity(client, client.inverter, "ac_out_temp",
                            "AC output temperature"),
                 TempEntity(client, client.ems, "battery_main_temp",
                            "Main battery temperature"),
-                TempEntity(client, extra, "battery_temp",
-                           "Extra battery temperature", 1),
                 TempEntity(client, client.pd, "car_out_temp",
                            "DC output temperature"),
                 TempEntity(client, client.pd, "typec_out1_temp",
@@ -171,13 +151,92 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
 
     async_add_entities(entities)
 
+    if is_power_station(client.product):
+        def add_pack(pack: BmsPack):
+            if is_delta(client.product):
+                (name, level) = (f"Extra{pack.idx} battery", "battery_level_f32")
+            else:
+                (name, level) = ("Extra battery", "battery_level")
+            async_add_entities([
+                CyclesEntity(client, pack.received, "battery_cycles",
+                             f"{name} cycles", pack.idx),
+                SingleLevelEntity(client, pack.received,
+                                  level, name, pack.idx),
+                TempEntity(client, pack.received, "battery_temp",
+                           f"{name} temperature", pack.idx),
+                *_health_entities(client, pack, name),
+            ])
+        track_extra_packs(entry, client, add_pack)
+
+    if fleet := client.fleet:
+        fleet.own(client.serial, lambda: async_add_entities([
+            FleetEnergyEntity(fleet, "in_energy", "Total input energy"),
+            FleetEnergyEntity(fleet, "out_energy", "Total output energy"),
+            FleetLevelEntity(fleet, "battery_level", "Battery"),
+            FleetWattsEntity(fleet, "in_power", "Total input"),
+            FleetWattsEntity(fleet, "out_power", "Total output"),
+        ]))
+
+
+def _health_entities(client: HassioEcoFlowClient, pack: BmsPack, name: str):
+    return [
+        CapacityFadeEntity(client, pack.health, "capacity_fade",
+                           f"{name} capacity fade", pack.idx),
+        ResistanceEntity(client, pack.health, "internal_resistance",
+                         f"{name} internal resistance", pack.idx),
+        StateOfHealthEntity(client, pack.health, "state_of_health",
+                            f"{name} state of health", pack.idx),
+    ]
+
 
 class BaseEntity(SensorEntity, EcoFlowEntity):
     def _on_updated(self, data: dict[str, Any]):
         self._attr_native_value = data[self._key]
 
 
-class CurrentEntity(BaseEntity):
+class MeasurementEntity(BaseEntity):
+    _samples: Optional[list[float]] = None
+
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        if self._client.bucket is not None:
+            self._samples = []
+            self._subscribe(self._client.bucket, self.__flush)
+            self._subscribe(self._client.repeated, self.__repeated)
+
+    def _publish(self):
+        if self._samples is None:
+            super()._publish()
+            return
+        if self._attr_native_value is not None:
+            self._samples.append(self._attr_native_value)
+        state = self.hass.states.get(self.entity_id)
+        if state is None or state.state == STATE_UNAVAILABLE:
+            super()._publish()
+
+    def __repeated(self, x: tuple[str, Any, Subject]):
+        # Skipped frames still count as a sample of the unchanged value
+        if x[2] is self._src and self._attr_native_value is not None:
+            self._samples.append(self._attr_native_value)
+
+    def __flush(self, *args):
+        if not self._samples:
+            return
+        self._attr_native_value = round(
+            sum(self._samples) / len(self._samples), 2)
+        self._samples.clear()
+        if self._attr_available:
+            self.async_write_ha_state()
+
+
+class CapacityFadeEntity(BaseEntity):
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_icon = "mdi:battery-minus-variant"
+    _attr_native_unit_of_measurement = "mAh/100 cycles"
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+
+class CurrentEntity(MeasurementEntity):
     _attr_device_class = SensorDeviceClass.CURRENT
     _attr_entity_category = EntityCategory.DIAGNOSTIC
     _attr_native_unit_of_measurement = ELECTRIC_CURRENT_AMPERE
@@ -200,14 +259,12 @@ class EnergyEntity(BaseEntity):
 class EnergySumEntity(EnergyEntity):
     def __init__(self, client: HassioEcoFlowClient, key: str, keys: list[str], name: str):
         super().__init__(client, client.pd, key, name)
-        self._suffix_len = len(key) + 1
-        self._keys = [f"{x}_{key}" for x in keys]
+        self._sources = {x: f"{x}_{key}" for x in keys}
 
     def _on_updated(self, data: dict[str, Any]):
-        values = {key[:-self._suffix_len]: data[key]
-                  for key in data if key in self._keys}
-        self._attr_extra_state_attributes = values
-        self._attr_native_value = sum(values.values())
+        super()._on_updated(data)
+        self._attr_extra_state_attributes = {
+            x: data[k] for (x, k) in self._sources.items() if k in data}
 
 
 class FanEntity(BaseEntity):
@@ -221,7 +278,67 @@ class FanEntity(BaseEntity):
         return "mdi:fan"
 
 
-class FrequencyEntity(BaseEntity):
+class FleetEntity(SensorEntity):
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_device_info = DeviceInfo(
+        entry_type=DeviceEntryType.SERVICE,
+        identifiers={(DOMAIN, "fleet")},
+        manufacturer="EcoFlow",
+        name="EcoFlow fleet",
+    )
+
+    def __init__(self, fleet: Fleet, key: str, name: str):
+        self._fleet = fleet
+        self._key = key
+        self._attr_name = name
+        self._attr_unique_id = f"fleet-{key.replace('_', '-')}"
+
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        self.async_on_remove(self._fleet.updated.subscribe(
+            self.__updated).dispose)
+        self.__updated(None)
+
+    def _value(self):
+        value = getattr(self._fleet, self._key)
+        if isinstance(value, Sum):
+            value = value.total if value.parts else None
+        return value
+
+    def __updated(self, _):
+        value = self._value()
+        self._attr_native_value = value
+        self._attr_available = value is not None
+        self.async_write_ha_state()
+
+
+class FleetEnergyEntity(FleetEntity):
+    _attr_device_class = SensorDeviceClass.ENERGY
+    _attr_native_unit_of_measurement = ENERGY_WATT_HOUR
+    _attr_state_class = SensorStateClass.TOTAL
+
+    def _value(self):
+        # A partial sum would look like a drop once the rest report
+        if not self._fleet.energy_complete:
+            return None
+        self._attr_last_reset = self._fleet.last_reset
+        return super()._value()
+
+
+class FleetLevelEntity(FleetEntity):
+    _attr_device_class = SensorDeviceClass.BATTERY
+    _attr_native_unit_of_measurement = PERCENTAGE
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+
+class FleetWattsEntity(FleetEntity):
+    _attr_device_class = SensorDeviceClass.POWER
+    _attr_native_unit_of_measurement = POWER_WATT
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+
+class FrequencyEntity(MeasurementEntity):
     _attr_device_class = SensorDeviceClass.FREQUENCY
     _attr_entity_category = EntityCategory.DIAGNOSTIC
     _attr_native_unit_of_measurement = FREQUENCY_HERTZ
@@ -233,7 +350,7 @@ class LevelEntity(BaseEntity):
     _attr_native_unit_of_measurement = PERCENTAGE
     _attr_state_class = SensorStateClass.MEASUREMENT
 
-    def __init__(self, client: HassioEcoFlowClient, src: Observable[dict[str, Any]], key: str, name: str, bms_id: Optional[int] = None):
+    def __init__(self, client: HassioEcoFlowClient, src: Subject[dict[str, Any]], key: str, name: str, bms_id: Optional[int] = None):
         super().__init__(client, src, key, name, bms_id)
         self._attr_extra_state_attributes = {}
 
@@ -250,6 +367,13 @@ class RemainEntity(BaseEntity):
             self._attr_native_value = utcnow() + value
 
 
+class ResistanceEntity(BaseEntity):
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_icon = "mdi:omega"
+    _attr_native_unit_of_measurement = "mΩ"
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+
 class SingleLevelEntity(LevelEntity):
     def _on_updated(self, data: dict[str, Any]):
         super()._on_updated(data)
@@ -261,41 +385,37 @@ class SingleLevelEntity(LevelEntity):
             self._attr_extra_state_attributes["capacity_design"] = data["battery_capacity_design"]
 
 
-class TempEntity(BaseEntity):
+class StateOfHealthEntity(BaseEntity):
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_icon = "mdi:battery-heart-variant"
+    _attr_native_unit_of_measurement = PERCENTAGE
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+
+class TempEntity(MeasurementEntity):
     _attr_device_class = SensorDeviceClass.TEMPERATURE
     _attr_entity_category = EntityCategory.DIAGNOSTIC
     _attr_native_unit_of_measurement = TEMP_CELSIUS
     _attr_state_class = SensorStateClass.MEASUREMENT
 
 
-class VoltageEntity(BaseEntity):
+class VoltageEntity(MeasurementEntity):
     _attr_device_class = SensorDeviceClass.VOLTAGE
     _attr_entity_category = EntityCategory.DIAGNOSTIC
     _attr_native_unit_of_measurement = ELECTRIC_POTENTIAL_VOLT
     _attr_state_class = SensorStateClass.MEASUREMENT
 
 
-class WattsEntity(BaseEntity):
+class WattsEntity(MeasurementEntity):
     _attr_device_class = SensorDeviceClass.POWER
     _attr_native_unit_of_measurement = POWER_WATT
     _attr_state_class = SensorStateClass.MEASUREMENT
 
-    def __init__(self, client: HassioEcoFlowClient, src: Observable[dict[str, Any]], key: str, name: str, real: Union[bool, int] = False):
+    def __init__(self, client: HassioEcoFlowClient, src: Subject[dict[str, Any]], key: str, name: str, real: bool = False):
         super().__init__(client, src, key, name)
         if key.endswith("_consumption"):
             self._key = key[:-11] + "out_power"
             self._attr_entity_category = EntityCategory.DIAGNOSTIC
-        self._real = real
-
-    def _on_updated(self, data: dict[str, Any]):
-        key = self._key[:-5]
-        if self._real is not False and f"{key}current" in data and f"{key}voltage" in data:
-            self._attr_native_value = (
-                data[f"{key}current"] * data[f"{key}voltage"])
-            if self._real is not True:
-                self._attr_native_value = round(
-                    self._attr_native_value, self._real)
-                if self._real == 0:
-                    self._attr_native_value = int(self._attr_native_value)
-        else:
-            super()._on_updated(data)
+        if real:
+            # Current x voltage, computed by the client's derived fields
+            self._key += "_real"